@@ -1,11 +1,10 @@
 import os
-import subprocess
+import queue
 import tkinter as tk
 from tkinter import ttk, filedialog
 import numpy as np
-import pandas as pd
-import openpyxl
 from HYDRUS_setting import HYDRUS2DSIMPLE_INIT
+from solver_Hydrus2D import SolverRun
 
 class Tableview(ttk.Treeview):
     def __init__(self, *args, **kwargs):
@@ -218,32 +217,14 @@ class HYDRUS2DSIMPLE_GUI(HYDRUS2DSIMPLE_INIT):
         if saveas:
             self.path = filedialog.askdirectory()
         os.makedirs(self.path, exist_ok=True)
-        if not os.path.isfile(self.path+r'\Domain.xlsx'):
+        if not os.path.isfile(self.DomainFile()):
             self.createDomainSheet()
-        data = self.read_Domain_xls(self.path+r'\Domain.xlsx')
-        nNode = np.where(data[0]!=0)[0]+1
-        self.write_Domain(data)
-        
-        width = []
-        for i in nNode:
-            if i%self.nnode_x == 0:
-                width.append((self.node_x[-1]-self.node_x[-2])/2)
-            elif i%self.nnode_x == 1:
-                width.append((self.node_x[1]-self.node_x[0])/2)
-            else:
-                width.append((self.node_x[(i+1)%self.nnode_x]-self.node_x[(i-1)%self.nnode_x])/2)
-        self.write_Boundary(nNode, width)
-        
-        nodes, mesh = self.GenerateMesh(self.node_x, self.node_z)
-        self.write_Meshtria(nodes, mesh)
-        self.write_Selector(self.TPrint)
-        
-        if self.AtmIn:
-            data = pd.read_excel(r'ATMOSPH.xlsx', 0).to_numpy()
-            self.write_ATMOSPH(data)
-        
-        self.write_Dimensio()
-        tk.messagebox.showinfo(title=None, message='Project was saved')
+        rewritten = self.WriteInputs()
+        if rewritten:
+            message = 'Project was saved\nRewritten: ' + ', '.join(rewritten)
+        else:
+            message = 'Project was saved\nAll input files are up to date'
+        tk.messagebox.showinfo(title=None, message=message)
     
     
     def SaveAsInputs(self):
@@ -251,9 +232,71 @@ class HYDRUS2DSIMPLE_GUI(HYDRUS2DSIMPLE_INIT):
         
         
     def Calculate(self):
-        subprocess.run(['H2D_Calc64.exe', self.path], shell=True)
-        print('Calculation done!')
-        pass
+        #the solver runs in the background, its screen output drives the progress window
+        run = SolverRun(self.path)
+
+        root = tk.Tk()
+        root.title('Calculation')
+        root.geometry('400x200')
+
+        frame1 = tk.Frame(root)
+        label1 = tk.Label(frame1, text='Time: {} / {} {}'.format(self.tInit, self.tMax, self.TUnit), anchor='w', width=45)
+        label2 = tk.Label(frame1, text='Iterations: -', anchor='w', width=45)
+        label3 = tk.Label(frame1, text='Time step: -', anchor='w', width=45)
+        bar = ttk.Progressbar(frame1, length=360, maximum=self.tMax-self.tInit)
+        bar.pack()
+        label1.pack()
+        label2.pack()
+        label3.pack()
+
+        def _Poll():
+            while True:
+                try:
+                    kind, value = run.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == 'progress':
+                    bar['value'] = value['time'] - self.tInit
+                    label1['text'] = 'Time: {:g} / {} {}'.format(value['time'], self.tMax, self.TUnit)
+                    label2['text'] = 'Iterations: {} (cumulative {})'.format(value['iterations'], value['cumulative'])
+                    if value['dt'] is not None:
+                        label3['text'] = 'Time step: {:g}'.format(value['dt'])
+                else:
+                    if kind == 'error':
+                        label2['text'] = 'Solver could not be started: {}'.format(value)
+                    elif run.cancelled:
+                        label2['text'] = 'Calculation was cancelled'
+                    else:
+                        label2['text'] = 'Calculation done! (exit code {})'.format(value)
+                    button__Cancel['state'] = tk.DISABLED
+                    return
+            polling[0] = root.after(200, _Poll)
+
+        def _Cancel():
+            run.cancel()
+
+        def _Close():
+            #a running calculation is cancelled first, the solver is not left running on its own
+            if run.is_alive():
+                if not tk.messagebox.askyesno(title='Calculation', message='Cancel the calculation and close?', parent=root):
+                    return
+                run.cancel()
+            root.after_cancel(polling[0])
+            root.destroy()
+
+        frame2 = tk.Frame(root)
+        button__Cancel = tk.Button(frame2, text="Cancel", command=_Cancel, width=7)
+        button__Close = tk.Button(frame2, text="Close", command=_Close, width=7)
+        root.protocol('WM_DELETE_WINDOW', _Close)
+        button__Cancel.pack()
+        button__Close.pack()
+
+        frame1.grid(row=0, column=0, padx=10, pady=10)
+        frame2.grid(row=0, column=1, padx=10, pady=10)
+
+        run.start()
+        polling = [root.after(200, _Poll)]
+        root.mainloop()
     
     
     def _Update_Tree(self):
@@ -696,39 +739,7 @@ class HYDRUS2DSIMPLE_GUI(HYDRUS2DSIMPLE_INIT):
         root.mainloop()
 
     def createDomainSheet(self):
-            
-        def writeData(sheet, data):
-            sheet.append(['']+list(range(1, self.nnode_x+1)))
-            for i, row in enumerate(data):
-                sheet.append([i+1]+row)
-        
-        wb = openpyxl.Workbook()
-        ws_Code = wb.active
-        ws_Code.title ='Code'
-        Code = np.full((self.nnode_z, self.nnode_x), 0).tolist()
-        writeData(ws_Code, Code)
-
-        ws_h = wb.create_sheet('h')
-        h = np.full((self.nnode_z, self.nnode_x), -100).tolist()
-        writeData(ws_h, h)
-
-        ws_Q = wb.create_sheet('Q')
-        Q = np.full((self.nnode_z, self.nnode_x), 0).tolist()
-        writeData(ws_Q, Q)
-        
-        ws_M = wb.create_sheet('M')
-        M = np.full((self.nnode_z, self.nnode_x), 1).tolist()
-        writeData(ws_M, M)
-
-        ws_Temp = wb.create_sheet('Temp')
-        Temp = np.full((self.nnode_z, self.nnode_x), 20).tolist()
-        writeData(ws_Temp, Temp)
-
-        ws_Conc = wb.create_sheet('Conc')
-        Conc = np.full((self.nnode_z, self.nnode_x), 0).tolist()
-        writeData(ws_Conc, Conc)
-        
-        wb.save(self.path + r'\Domain.xlsx')
+        self.write_Domain_xls(os.path.join(self.path, 'Domain.xlsx'))
         tk.messagebox.showinfo(title=None, message='New Domain.xlsx was created')
 
     def main_process(self):
@@ -4,10 +4,24 @@ Created on Wed Jan 25 16:06:25 2023
 
 @author: toru1
 """
+import os
+import re
+import string
+import hashlib
+import contextlib
+import zipfile
+from xml.etree import ElementTree
 import numpy as np
 import pandas as pd
+import openpyxl
 
 class HYDRUS2DSIMPLE_INIT:
+    #nodal values of Domain.xlsx / Domain.npz
+    Domain_heads = {'Code': int, 'h': float, 'Q': float, 'M': int, 'Temp': float, 'Conc': float}
+    Domain_template = {'Code': 0, 'h': -100, 'Q': 0, 'M': 1, 'Temp': 20, 'Conc': 0}
+    #scaling factors, constants unless a sheet / array of the same name holds nodal values
+    Domain_scaling = {'Beta': 0, 'Axz': 1, 'Bxz': 1, 'Dxz': 1}
+
     def __init__(self):
         # %%1 new project
         self.Heading = 'Welcome to HYDRUS'
@@ -543,6 +557,8 @@ class HYDRUS2DSIMPLE_INIT:
         self.Bxz = 1         # the dimensionless scaling factor αK [-] associated with the saturated hydraulic conductivity.
         self.Dxz = 1         # dimensionless scaling factor αθ [-] associated with the water content.
         self.Beta = 0        # Value of the water uptake distribution, b(x,y,z)
+        # Axz, Bxz, Dxz and Beta may also be per-node arrays (grid numbering) read from the sheets of the same name in Domain.xlsx or Domain.npz
+        self._Domain_scaled = {}  # scaling arrays taken from the last Domain file read
 
         # %% anisotropy
         self.AnizA1 = 1      # First principal component, K1, of the dimensionless tensor KA which describes the local anisotropy of the hydraulic conductivity assigned to element e.
@@ -562,16 +578,25 @@ class HYDRUS2DSIMPLE_INIT:
         # %% flowing particles
         self.NPart = 0       # Number of fictional particles, for which their trajectory is to be calculated.
 
+        # %% node renumbering
+        self.Renumber = False    # nodes are renumbered (reverse Cuthill-McKee) to minimize the bandwidth of matrix A
+        self.NodeOrder = None    # grid node (0-based) of every renumbered node, None when the grid numbering is used
+
+        # %% saved input files
+        self.InputHash = {}      # input file path: hash of the parameters it was last written from
+        self.MeshHash = None     # hash of the grid and Domain file NumNP, NumEl, NumBP, MBan and NodeOrder were computed from
+
         # %%
         self.NSeep = 1       # Maximum number of seepage faces
         self.NumSP = 1       # Maximum number of nodes along a seepage face
         self.NumBP = 0     # Maximum number of boundary nodes for which Kode(n)≠0
-        self.MBan = 30       # Maximum dimension of the bandwidth of matrix A
+        self.MBan = 30       # Maximum dimension of the bandwidth of matrix A (computed from the mesh when saved)
         self.SeepF = False     # seepage faces is to be considered.
         self.FreeD = False     # free drainage is used at the bottom boundary.
         self.qQWLF = False     # the discharge-groundwater level relationship is used at the bottom
                 
         self.atmosph_data = [[1, 0, 0, 0.4, 10000, 0, 0, 0, 0, 0, 0, 0, 0]]
+        self.AtmFile = 'ATMOSPH.xlsx'    # atmospheric data written to Atmosph.in (first sheet)
         self.hCritS = 0      # Maximum allowed pressure head at the soil surface
 
         self.lDummy = False    # Logical dummy variable
@@ -586,49 +611,224 @@ class HYDRUS2DSIMPLE_INIT:
         return list_t_f
         
     def GenerateMesh(self, node_x, node_z):
-        #create nodes array
-        x, z = np.meshgrid(node_x, node_z[::-1])
-        nodes = np.vstack((x.flatten(), z.flatten())).T
-        
-        #create mesh array
+        x = np.asarray(node_x)
+        z = np.asarray(node_z)[::-1]
+        nx, nz = x.size, z.size
+
+        #create nodes array (row-major from the top row)
+        nodes = np.empty((nx*nz, 2), dtype=np.result_type(x, z))
+        nodes[:, 0] = np.tile(x, nz)
+        nodes[:, 1] = np.repeat(z, nx)
+
+        #create mesh array, two triangles per cell
         #i_ k   i
         # \|j   j|_\k
-        
-        i = [i for i in range(1, self.NumNP) if i%(self.NSurf+1)][:-self.NSurf]
-        i = np.array([i, i])
-        i = i.T.flatten()
-
-        j = [j for j in range(1, self.NumNP) if j%(self.NSurf+1)][self.NSurf:]
-        j = np.array([j, j])
-        j[0] += 1
-        j = j.T.flatten()
-        
-        k = [k+1 for k in range(1, self.NumNP) if k%(self.NSurf+1)][:-self.NSurf]
-        k = np.array([k, k])
-        k[1] += (self.NSurf+1)
-        k = k.T.flatten()
-        
-        mesh = np.array([i, j, k]).T
+
+        #upper-left node of every cell
+        i = np.arange(1, nx, dtype=np.int32) + nx*np.arange(nz-1, dtype=np.int32)[:, None]
+        i = i.ravel()
+
+        mesh = np.empty((2*i.size, 3), dtype=np.int32)
+        mesh[0::2, 0] = i
+        mesh[0::2, 1] = i + nx + 1
+        mesh[0::2, 2] = i + 1
+        mesh[1::2, 0] = i
+        mesh[1::2, 1] = i + nx
+        mesh[1::2, 2] = i + nx + 1
         return nodes, mesh
 
 
+    def _Adjacency(self, mesh):
+        #node graph of the mesh in CSR form, neighbours sorted by degree
+        NumNP = int(mesh.max())
+        a = mesh[:, [0, 1, 2, 1, 2, 0]].astype(np.int64).ravel() - 1
+        b = mesh[:, [1, 2, 0, 0, 1, 2]].astype(np.int64).ravel() - 1
+        key = np.sort(a*NumNP + b)
+        key = key[np.append(True, key[1:] != key[:-1])]
+        row, col = key//NumNP, key%NumNP
+
+        indptr = np.zeros(NumNP+1, dtype=np.int64)
+        np.cumsum(np.bincount(row, minlength=NumNP), out=indptr[1:])
+        degree = np.diff(indptr)
+        col = col[np.lexsort((col, degree[col], row))]
+        return indptr, col, degree
+
+    def _Levels(self, indptr, col, start, visited):
+        #Cuthill-McKee level sets starting from node start
+        visited[start] = True
+        levels = [np.array([start])]
+        while True:
+            frontier = levels[-1]
+            first = indptr[frontier]
+            count = indptr[frontier+1] - first
+            offset = np.repeat(first - np.cumsum(count) + count, count)
+            nbrs = col[offset + np.arange(count.sum())]
+            nbrs = nbrs[~visited[nbrs]]
+            if nbrs.size == 0:
+                return levels
+            #first occurrence keeps the order of the parents and their degree
+            _, index = np.unique(nbrs, return_index=True)
+            level = nbrs[np.sort(index)]
+            visited[level] = True
+            levels.append(level)
+
+    def RenumberNodes(self, nodes, mesh):
+        #reverse Cuthill-McKee renumbering of the nodes,
+        #stores the grid node of every new node in self.NodeOrder
+        indptr, col, degree = self._Adjacency(mesh)
+        NumNP = degree.size
+        visited = np.zeros(NumNP, dtype=bool)
+        order = []
+        while not visited.all():
+            #pseudo-peripheral start node of the next connected component
+            unvisited = np.where(~visited)[0]
+            start = unvisited[np.argmin(degree[unvisited])]
+            levels = self._Levels(indptr, col, start, visited.copy())
+            while True:
+                last = levels[-1]
+                candidate = last[np.argmin(degree[last])]
+                candidate_levels = self._Levels(indptr, col, candidate, visited.copy())
+                if len(candidate_levels) <= len(levels):
+                    break
+                start, levels = candidate, candidate_levels
+            order.extend(self._Levels(indptr, col, start, visited))
+
+        self.NodeOrder = np.concatenate(order)[::-1]
+        NodeNumber = np.empty(NumNP, dtype=mesh.dtype)
+        NodeNumber[self.NodeOrder] = np.arange(1, NumNP+1)
+        return nodes[self.NodeOrder], NodeNumber[mesh-1]
+
+    def NodeNumber(self, nGrid):
+        #grid node numbers -> node numbers written to the input files
+        if self.NodeOrder is None:
+            return nGrid
+        NodeNumber = np.empty(self.NodeOrder.size, dtype=int)
+        NodeNumber[self.NodeOrder] = np.arange(1, self.NodeOrder.size+1)
+        return NodeNumber[np.asarray(nGrid, dtype=int)-1]
+
+    def GridNumber(self, nNode):
+        #node numbers read from the input files -> grid node numbers
+        if self.NodeOrder is None:
+            return nNode
+        return self.NodeOrder[np.asarray(nNode, dtype=int)-1]+1
+
+    def _nodal(self, value):
+        #nodal array in grid numbering -> node numbering, constants are left as they are
+        if self.NodeOrder is None or np.ndim(value) == 0:
+            return value
+        return np.asarray(value)[self.NodeOrder]
+
+    def BandWidth(self, mesh):
+        return int((mesh.max(axis=1) - mesh.min(axis=1)).max()) + 1
+
+
+    def _format_column(self, spec, column):
+        #formatted values of column as a (n, width) array of ASCII codes when
+        #they share one width, otherwise as an object array of str
+        column = np.asarray(column)
+        if column.dtype.kind in 'iu' and re.fullmatch(r'>\d+d?', spec) and column.size:
+            width = int(spec.strip('>d'))
+            value = np.abs(column.astype(np.int64))
+            if value.max() < 2**31:
+                value = value.astype(np.int32)
+            sign = column < 0
+            ndigit = np.searchsorted(10**np.arange(1, 19, dtype=np.int64), value, side='right')+1
+            digits = ndigit.max()
+            if not np.any(ndigit+sign > width):
+                field = np.full((column.size, width), 32, dtype=np.uint8)
+                for k in range(digits):
+                    field[:, width-1-k] = np.where(ndigit > k, value%10+48, 32)
+                    value //= 10
+                field[sign, width-1-ndigit[sign]] = ord('-')
+                return field
+
+        #format every distinct value only once
+        key = column.view('u{}'.format(column.itemsize)) if column.dtype.kind == 'f' else column
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        first = np.append(True, key[1:] != key[:-1])
+        inverse = np.empty(column.size, dtype=np.intp)
+        inverse[order] = np.cumsum(first)-1
+        text = [('{:'+spec+'}').format(v) for v in column[order[first]].tolist()]
+        if len(set(map(len, text))) == 1 and ''.join(text).isascii():
+            table = np.frombuffer(''.join(text).encode('ascii'), dtype=np.uint8)
+            return table.reshape(len(text), -1)[inverse]
+        return np.array(text, dtype=object)[inverse]
+
+    def _write_table(self, f, fmt, columns, nrows, chunk=100000):
+        #same as f.write(fmt.format(*row)+'\n') for every row of columns,
+        #scalar columns are formatted once and the lines are written in blocks
+        if nrows == 0:
+            return
+        parts = []
+        for (literal, field, spec, conversion), column in zip(string.Formatter().parse(fmt), columns+[None]):
+            parts.append(literal)
+            if field is None:
+                continue
+            elif np.ndim(column) == 0:
+                parts.append(('{:'+spec+'}').format(column))
+            else:
+                parts.append(self._format_column(spec, column[:nrows]))
+        parts.append('\n')
+
+        #merge neighbouring constant parts
+        blocks = [parts[0]]
+        for part in parts[1:]:
+            if isinstance(part, str) and isinstance(blocks[-1], str):
+                blocks[-1] += part
+            else:
+                blocks.append(part)
+
+        if all(b.isascii() if isinstance(b, str) else b.dtype == np.uint8 for b in blocks):
+            #fixed-width lines, assembled as one block of ASCII codes
+            widths = [len(b) if isinstance(b, str) else b.shape[1] for b in blocks]
+            edges = np.cumsum([0]+widths)
+            for start in range(0, nrows, chunk):
+                stop = min(start+chunk, nrows)
+                lines = np.empty((stop-start, edges[-1]), dtype=np.uint8)
+                for b, e0, e1 in zip(blocks, edges[:-1], edges[1:]):
+                    lines[:, e0:e1] = np.frombuffer(b.encode('ascii'), dtype=np.uint8) if isinstance(b, str) else b[start:stop]
+                f.write(lines.tobytes().decode('ascii'))
+            return
+
+        blocks = [b if isinstance(b, str) or b.dtype == object else
+                  np.array([r.decode('ascii') for r in b.view('S{}'.format(b.shape[1])).ravel()], dtype=object)
+                  for b in blocks]
+        for start in range(0, nrows, chunk):
+            stop = min(start+chunk, nrows)
+            cols = [[b]*(stop-start) if isinstance(b, str) else b[start:stop] for b in blocks]
+            f.write(''.join(map(''.join, zip(*cols))))
+
+    @contextlib.contextmanager
+    def _replace(self, filename, mode='w'):
+        #the file is written under a temporary name that then replaces it, so that the file
+        #is never changed in place: its hardlinks (see sweep_Hydrus2D) keep the old content
+        temp = filename+'.tmp'
+        try:
+            with open(temp, mode) as f:
+                yield f
+            os.replace(temp, filename)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
     def write_Meshtria(self, nodes, mesh):
-        with open(self.path+  '\\Meshtria.txt', 'w') as (f):
+        with self._replace(os.path.join(self.path, 'Meshtria.txt')) as (f):
             f.write(('{:>10}'*5).format(1, self.NumNP, 1, self.NumEl, 1)+'\n')
-            for i in range(self.NumNP):
-                f.write('{:>6}{:>14}{:>14}'.format(i+1, nodes[i, 0], nodes[i, 1])+'\n')
+            self._write_table(f, '{:>6}{:>14}{:>14}',
+                              [np.arange(1, self.NumNP+1), nodes[:, 0], nodes[:, 1]], self.NumNP)
             f.write('Edges\n')
             f.write('\n')
             f.write('       e            i            j            k'+'\n')
-            for e in range(self.NumEl):
-                f.write(' {:>7} {:>12} {:>12} {:>12}'.format(e+1, mesh[e, 0], mesh[e, 1], mesh[e, 2])+'\n')
+            self._write_table(f, ' {:>7} {:>12} {:>12} {:>12}',
+                              [np.arange(1, self.NumEl+1), mesh[:, 0], mesh[:, 1], mesh[:, 2]], self.NumEl)
             
             f.write('*** End of File *************************************************************************************************************'+'\n')
             f.close()
 
 
     def write_Selector(self, TPrint):
-        with open(self.path+  '\\Selector.in', 'w') as (f):
+        with self._replace(os.path.join(self.path, 'Selector.in')) as (f):
             file_version = 4
             f.write('Pcp_File_Version={}'.format(file_version)+'\n')
             f.write('*** BLOCK A: BASIC INFORMATION *****************************************'+'\n')      
@@ -893,7 +1093,7 @@ class HYDRUS2DSIMPLE_INIT:
             nNode = [0]
             Width = [0]
 
-        with open(self.path+  '\\Boundary.in', 'w') as (f):
+        with self._replace(os.path.join(self.path, 'Boundary.in')) as (f):
             file_version = 5
             f.write('Pcp_File_Version={}'.format(file_version)+'\n')
             f.write('*** BLOCK J: BOUNDARY INFORMATION *********************************************'+'\n')
@@ -957,7 +1157,7 @@ class HYDRUS2DSIMPLE_INIT:
             
             if self.NObs != 0:
                 f.write('Observation nodes. Node(1,....self.NObs)'+'\n')
-                f.write(('{:>8} '*self.NObs).format(*self.Obs_nodes)+'\n')
+                f.write(('{:>8} '*self.NObs).format(*self.NodeNumber(self.Obs_nodes))+'\n')
             
             f.write('Number of Flowing points and their indeces'+'\n')
             f.write('{:>5}'.format(self.NPart)+'\n')
@@ -968,7 +1168,7 @@ class HYDRUS2DSIMPLE_INIT:
                 f.write('{:>3} {:>3}'.format(self.NDr, self.DrCorr)+'\n')
                 
                 f.write('ND(1,..,NDr)                              (global numbers of the drains)'+'\n')
-                f.write(('{:>8} '*self.NDr).format(*self.ND)+'\n')
+                f.write(('{:>8} '*self.NDr).format(*self.NodeNumber(self.ND))+'\n')
                 
                 f.write('NElD(1,..,NDr)                (number of elements surrounding the drain)'+'\n')
                 f.write('{:>8} '.format(self.NELD)+'\n')
@@ -1000,7 +1200,7 @@ class HYDRUS2DSIMPLE_INIT:
             f.close()
         
     def write_Dimensio(self):
-        with open(self.path+  '\\Dimensio.in', 'w') as (f):
+        with self._replace(os.path.join(self.path, 'Dimensio.in')) as (f):
             file_version = 3
             f.write('Pcp_File_Version={}'.format(file_version)+'\n')
             f.write('  NumNPD  NumElD  NumBPD  MBandD  NSeepD  NumSPD    NDrD  NElDrD   NMatD   NObsD     NSD   NAnis'+'\n')
@@ -1010,17 +1210,227 @@ class HYDRUS2DSIMPLE_INIT:
             f.close()
 
 
+    def _xlsx_sheets(self, archive):
+        #sheet name -> worksheet xml in the archive of a .xlsx file
+        ns = {'m': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+              'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+              'p': 'http://schemas.openxmlformats.org/package/2006/relationships'}
+        rels = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+        target = {rel.get('Id'): rel.get('Target') for rel in rels.findall('p:Relationship', ns)}
+        workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+        paths = {}
+        for s in workbook.findall('m:sheets/m:sheet', ns):
+            path = target[s.get('{{{}}}id'.format(ns['r']))]
+            paths[s.get('name')] = path.lstrip('/') if path.startswith('/') else 'xl/'+path
+        return paths
+
+    def _read_sheet_xml(self, source, chunk=1 << 22):
+        #values of the numeric cells below the header row and right of the index column,
+        #returns None if the sheet cannot be read as plain numbers
+        cell = re.compile(rb'<c\s([^>]*?)\br="([A-Z]+)([0-9]+)"([^>]*?)(?:/>|>(?:<f[^>]*?(?:/>|>.*?</f>))?(?:<v>([^<]*)</v>)?.*?</c>)', re.S)
+        #cells without a reference (r is optional) are placed by their order, left to openpyxl
+        anonymous = re.compile(rb'<c(?:\s(?![^>]*\br=)[^>]*)?/?>')
+        cells = []
+        rest = b''
+        while True:
+            block = source.read(chunk)
+            block, end = rest+block, not block
+            cut = len(block) if end else block.rfind(b'</row>')+6
+            if cut < 6 and not end:
+                rest = block
+                continue
+            if anonymous.search(block, 0, cut):
+                return None
+            cells.extend(cell.findall(block, 0, cut))
+            rest = block[cut:]
+            if end:
+                break
+        if not cells:
+            return None
+
+        before, cols, rows, after, values = map(np.array, zip(*cells))
+        letters, col = np.unique(cols, return_inverse=True)
+        number = [sum((ord(c)-64)*26**i for i, c in enumerate(reversed(l.decode()))) for l in letters]
+        col = np.array(number)[col] - 1
+        row = rows.astype(int) - 1
+        #the attributes before and after the reference
+        text = np.zeros(row.size, bool)
+        for attrs in (before, after):
+            attrs, kind = np.unique(attrs, return_inverse=True)
+            text |= np.array([re.search(rb'\bt="(?:s|str|inlineStr|e)"', a) is not None for a in attrs])[kind]
+        inside = (row > 0) & (col > 0)
+        if np.any(text & inside):
+            return None
+        values = values[inside]
+        values[values == b''] = b'nan'
+        try:
+            values = values.astype(float)
+        except ValueError:
+            return None
+        data = np.full((row.max(), col.max()), np.nan)
+        data[row[inside]-1, col[inside]-1] = values
+        return data[~np.isnan(data).all(axis=1)]
+
     def read_Domain_xls(self, sheet):
+        #all sheets are read in one streaming pass over the workbook,
+        #sheets holding more than plain numbers go through openpyxl in read-only mode
         data_domain = []
-        head_type = ['Code', 'h', 'Q', 'M', 'Temp', 'Conc']
-        for h in head_type:
-            data = pd.read_excel(sheet, h, header=0, index_col=0, dtype=int)
-            data_domain.append(data.to_numpy().flatten())
+        scaled = {}
+        with zipfile.ZipFile(sheet) as archive:
+            paths = self._xlsx_sheets(archive)
+            for h in list(self.Domain_heads)+[s for s in self.Domain_scaling if s in paths]:
+                with archive.open(paths[h]) as source:
+                    data = self._read_sheet_xml(source)
+                if data is None:
+                    wb = openpyxl.load_workbook(sheet, read_only=True, data_only=True)
+                    rows = wb[h].iter_rows(min_row=2, min_col=2, values_only=True)
+                    data = np.array([row for row in rows if any(v is not None for v in row)], dtype=float)
+                    wb.close()
+                if np.isnan(data).any():
+                    raise ValueError('empty cells in sheet {} of {}'.format(h, sheet))
+                if h in self.Domain_scaling:
+                    scaled[h] = data.ravel()
+                    continue
+                data_domain.append(data.ravel().astype(self.Domain_heads[h]))
+        self._scale_Domain(scaled)
         return data_domain
 
+    def _scale_Domain(self, scaled):
+        #scaling arrays of the Domain file replace the constants, an array left from an earlier
+        #file falls back to the default, constants set by the user are kept
+        for h, value in self._Domain_scaled.items():
+            if h not in scaled and self.__dict__[h] is value:
+                self.__dict__[h] = self.Domain_scaling[h]
+        self.__dict__.update(scaled)
+        self._Domain_scaled = scaled
+
+
+    def _column_letter(self, col):
+        letter = ''
+        while col > 0:
+            col, r = divmod(col-1, 26)
+            letter = chr(65+r) + letter
+        return letter
+
+    def write_Domain_xls(self, sheet, values=None):
+        #template of the nodal values, one sheet per head type with nnode_z rows and nnode_x columns,
+        #the worksheet xml is streamed row by row into the archive.
+        #values: sheet name -> constant or nodal array (grid numbering), default template if None
+        if values is None:
+            values = self.Domain_template
+        main = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+        rels = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+        package = 'http://schemas.openxmlformats.org/package/2006/relationships'
+        content = 'application/vnd.openxmlformats-officedocument.spreadsheetml.'
+        letters = [self._column_letter(i+1) for i in range(self.nnode_x+1)]
+        last = '{}{}'.format(letters[-1], self.nnode_z+1)
+
+        with self._replace(sheet, 'wb') as f, zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('[Content_Types].xml',
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                '<Default Extension="xml" ContentType="application/xml"/>'
+                '<Override PartName="/xl/workbook.xml" ContentType="{0}sheet.main+xml"/>'
+                '<Override PartName="/xl/styles.xml" ContentType="{0}styles+xml"/>'.format(content)
+                + ''.join('<Override PartName="/xl/worksheets/sheet{}.xml" ContentType="{}worksheet+xml"/>'
+                          .format(i+1, content) for i in range(len(values)))
+                + '</Types>')
+            archive.writestr('_rels/.rels',
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<Relationships xmlns="{}"><Relationship Id="rId1" Target="xl/workbook.xml" '
+                'Type="{}/officeDocument"/></Relationships>'.format(package, rels))
+            archive.writestr('xl/workbook.xml',
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<workbook xmlns="{}" xmlns:r="{}"><sheets>'.format(main, rels)
+                + ''.join('<sheet name="{}" sheetId="{}" r:id="rId{}"/>'.format(name, i+1, i+1)
+                          for i, name in enumerate(values))
+                + '</sheets></workbook>')
+            archive.writestr('xl/_rels/workbook.xml.rels',
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<Relationships xmlns="{}">'.format(package)
+                + ''.join('<Relationship Id="rId{0}" Target="worksheets/sheet{0}.xml" Type="{1}/worksheet"/>'
+                          .format(i+1, rels) for i in range(len(values)))
+                + '<Relationship Id="rId{}" Target="styles.xml" Type="{}/styles"/>'.format(len(values)+1, rels)
+                + '</Relationships>')
+            archive.writestr('xl/styles.xml',
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<styleSheet xmlns="{}"><fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+                '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+                '<borders count="1"><border/></borders>'
+                '<cellStyleXfs count="1"><xf/></cellStyleXfs><cellXfs count="1"><xf xfId="0"/></cellXfs>'
+                '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+                '</styleSheet>'.format(main))
+
+            #header row with the column numbers, then one row per z node led by its row number
+            header = '<row r="1">'+''.join('<c r="{}1"><v>{}</v></c>'.format(letters[j+1], j+1)
+                                           for j in range(self.nnode_x))+'</row>'
+            for i, value in enumerate(values.values()):
+                if np.ndim(value) == 0:
+                    row = ('<row r="{0}"><c r="A{0}"><v>{1}</v></c>'
+                           + ''.join('<c r="{}{{0}}"><v>{}</v></c>'.format(letters[j+1], value)
+                                     for j in range(self.nnode_x))
+                           + '</row>')
+                    rows = (row.format(n+2, n+1) for n in range(self.nnode_z))
+                else:
+                    cell = ['<c r="{}{{0}}"><v>{{{}}}</v></c>'.format(letters[j+1], j+2) for j in range(self.nnode_x)]
+                    row = '<row r="{0}"><c r="A{0}"><v>{1}</v></c>'+''.join(cell)+'</row>'
+                    grid = np.reshape(value, (self.nnode_z, self.nnode_x)).tolist()
+                    rows = (row.format(n+2, n+1, *grid[n]) for n in range(self.nnode_z))
+                with archive.open('xl/worksheets/sheet{}.xml'.format(i+1), 'w', force_zip64=True) as f:
+                    f.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                            '<worksheet xmlns="{}"><dimension ref="A1:{}"/><sheetData>{}'
+                            .format(main, last, header).encode())
+                    for line in rows:
+                        f.write(line.encode())
+                    f.write(b'</sheetData></worksheet>')
+
+    def read_Domain_npz(self, store):
+        #nodal values saved by write_Domain_npz, same layout as read_Domain_xls
+        data_domain = []
+        with np.load(store) as f:
+            for h in self.Domain_heads:
+                data_domain.append(f[h].ravel().astype(self.Domain_heads[h]))
+            scaled = {h: f[h].ravel().astype(float) for h in self.Domain_scaling if h in f.files}
+        self._scale_Domain(scaled)
+        return data_domain
+
+    def write_Domain_npz(self, store, values=None):
+        #nodal values as (nnode_z, nnode_x) arrays in an uncompressed .npz,
+        #values: name -> constant or nodal array (grid numbering), default template if None
+        if values is None:
+            values = self.Domain_template
+        arrays = {}
+        for h, value in values.items():
+            dtype = self.Domain_heads.get(h, float)
+            arrays[h] = np.broadcast_to(np.asarray(value, dtype=dtype).reshape(
+                (self.nnode_z, self.nnode_x) if np.ndim(value) else ()), (self.nnode_z, self.nnode_x))
+        with self._replace(store, 'wb') as f:
+            np.savez(f, **arrays)
+
+    def read_Domain(self, filename):
+        if os.path.splitext(filename)[1].lower() == '.npz':
+            return self.read_Domain_npz(filename)
+        return self.read_Domain_xls(filename)
+
+    def convert_Domain(self, source, target):
+        #Domain.xlsx <-> Domain.npz, the format follows the file extensions
+        values = dict(zip(self.Domain_heads, self.read_Domain(source)))
+        for h in self.Domain_scaling:
+            if np.ndim(self.__dict__[h]):
+                values[h] = self.__dict__[h]
+        if os.path.splitext(target)[1].lower() == '.npz':
+            self.write_Domain_npz(target, values)
+        else:
+            self.write_Domain_xls(target, values)
+
+    def DomainFile(self):
+        #Domain.npz is used in place of Domain.xlsx when both exist
+        store = os.path.join(self.path, 'Domain.npz')
+        return store if os.path.isfile(store) else os.path.join(self.path, 'Domain.xlsx')
 
     def write_Domain(self, data):
-        with open(self.path+  '\\Domain.dat', 'w') as (f):
+        with self._replace(os.path.join(self.path, 'Domain.dat')) as (f):
             file_version = 2
             f.write('Pcp_File_Version={}'.format(file_version)+'\n')
             f.write('*** BLOCK H: DOMAIN INFORMATION ******************************************************'+'\n')
@@ -1030,25 +1440,22 @@ class HYDRUS2DSIMPLE_INIT:
                     .format(self.NS, self.Equilib)+'\n')
             f.write('Nodal Information'+'\n')
             f.write('         n   Code          h              Q    M     Beta      Axz      Bxz      Dxz        Temp   Conc(1..NS)   '+'\n')
-            for i in range(self.NumNP):
-                f.write('{:>10d} {:>6} {:>11} {:>13} {:>4} {:>8} {:>8} {:>8} {:>8} {:>11}'
-                        .format(i+1, data[0][i], data[1][i], data[2][i], data[3][i],
-                                self.Beta, self.Axz, self.Bxz, self.Dxz, data[4][i]))
-                for j in range(self.NS):
-                    f.write(' {:>13}'.format(data[j+5][i]))
-                f.write('\n')
+            self._write_table(f, '{:>10d} {:>6} {:>11} {:>13} {:>4} {:>8} {:>8} {:>8} {:>8} {:>11}'+' {:>13}'*self.NS,
+                              [np.arange(1, self.NumNP+1), data[0], data[1], data[2], data[3],
+                               *[self._nodal(v) for v in (self.Beta, self.Axz, self.Bxz, self.Dxz)], data[4]]+[data[j+5] for j in range(self.NS)],
+                              self.NumNP)
             
             f.write('*** BLOCK I: ELEMENT INFORMATION ******************************************************'+'\n')
             f.write('         e  Angle  AnizA1 AnizA2 LayNum'+'\n')
-            for e in range(1, self.NumEl+1):
-                f.write('{:>10} {:>6} {:>6} {:>6} {:>5} '
-                        .format(e, self.Angle, self.AnizA1, self.AnizA2, self.LayNum)+'\n')
+            self._write_table(f, '{:>10} {:>6} {:>6} {:>6} {:>5} ',
+                              [np.arange(1, self.NumEl+1), self.Angle, self.AnizA1, self.AnizA2, self.LayNum],
+                              self.NumEl)
             f.write('*** End of input file \'DOMAIN.IN\' ****************************************************'+'\n')
             f.close()  
             
             
     def write_ATMOSPH(self, data):
-        with open(self.path+  '\\Atmosph.in', 'w') as (f):
+        with self._replace(os.path.join(self.path, 'Atmosph.in')) as (f):
             file_version = 3
             f.write('Pcp_File_Version={}\n'.format(file_version))
             f.write('*** BLOCK K: ATMOSPHERIC INFORMATION  **********************************'+'\n')
@@ -1065,6 +1472,152 @@ class HYDRUS2DSIMPLE_INIT:
             f.write('*** END OF INPUT FILE \'ATMOSPH.IN\' *************************************'+'\n')
             f.close()
     
+    def _digest(self, *values):
+        h = hashlib.sha1()
+        for v in values:
+            if isinstance(v, np.ndarray) and v.dtype != object:
+                h.update('{}{}'.format(v.dtype.str, v.shape).encode())
+                h.update(np.ascontiguousarray(v).tobytes())
+            elif isinstance(v, (list, tuple, np.ndarray)):
+                h.update('[{}'.format(len(v)).encode())
+                h.update(self._digest(*v).encode())
+            elif isinstance(v, dict):
+                h.update('{{{}'.format(len(v)).encode())
+                h.update(self._digest(*v.items()).encode())
+            else:
+                h.update(repr(v).encode())
+            h.update(b';')
+        return h.hexdigest()
+
+    _file_digests = {}
+
+    def _file_digest(self, filename):
+        if not os.path.isfile(filename):
+            return None
+        #hardlinked copies share the inode, so a file is hashed once until it changes
+        st = os.stat(filename)
+        stamp = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        if stamp not in self._file_digests:
+            h = hashlib.sha1()
+            with open(filename, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+            self._file_digests[stamp] = h.hexdigest()
+        return self._file_digests[stamp]
+
+    def _Dependencies(self, method):
+        #parameters read by a write_* method and the methods it calls
+        names, seen = set(), set()
+        codes = [method.__code__]
+        while codes:
+            code = codes.pop()
+            for name in code.co_names:
+                attr = getattr(type(self), name, None)
+                if name in self.__dict__:
+                    names.add(name)
+                elif hasattr(attr, '__code__') and name not in seen:
+                    seen.add(name)
+                    codes.append(attr.__code__)
+            codes.extend(c for c in code.co_consts if hasattr(c, 'co_names'))
+        return sorted(names - {'path', 'InputHash'})
+
+    def _InputSources(self):
+        #input file -> (write_* method, inputs that are not parameters of the instance)
+        grid = self._digest(self.node_x, self.node_z, self.Renumber)
+        domain = self._digest(grid, self.nnode_x, self._file_digest(self.DomainFile()))
+        sources = {
+            'Meshtria.txt': (self.write_Meshtria, grid),
+            'Domain.dat': (self.write_Domain, domain),
+            'Boundary.in': (self.write_Boundary, domain),
+            'Selector.in': (self.write_Selector, self.TPrint),
+            }
+        if self.AtmIn:
+            sources['Atmosph.in'] = (self.write_ATMOSPH, self._file_digest(self.AtmFile))
+        #NumNP, NumEl, NumBP and MBan follow from the mesh and Domain file
+        sources['Dimensio.in'] = (self.write_Dimensio, domain)
+        return sources
+
+    def _InputKey(self, sources, name):
+        method, *inputs = sources[name]
+        return self._digest(inputs, [(n, self.__dict__[n]) for n in self._Dependencies(method)])
+
+    def InputKeys(self):
+        #hash of everything each input file is written from, equal hashes give identical files
+        sources = self._InputSources()
+        return {name: self._InputKey(sources, name) for name in sources}
+
+    def WriteInputs(self, force=False, files=None):
+        #write the input files whose parameters changed since they were last written,
+        #only the names in files if given, returns the names of the rewritten files
+        domain_file = self.DomainFile()
+        sources = self._InputSources()
+        domain = sources['Dimensio.in'][1]
+        if files is not None:
+            sources = {name: sources[name] for name in sources if name in files}
+
+        def _key(name):
+            return self._InputKey(sources, name)
+
+        def _dirty(name):
+            filename = os.path.join(self.path, name)
+            return name in sources and (force or not os.path.isfile(filename) or self.InputHash.get(filename) != _key(name))
+
+        rewritten = []
+        def _written(name):
+            #the writers update some parameters (NumBP, ...), so the hash is taken afterwards
+            self.InputHash[os.path.join(self.path, name)] = _key(name)
+            rewritten.append(name)
+
+        mesh_files = [name for name in ('Meshtria.txt', 'Domain.dat', 'Boundary.in') if _dirty(name)]
+        dimensio = _dirty('Dimensio.in')
+        if mesh_files or dimensio and self.MeshHash != domain:
+            data = self.read_Domain(domain_file)
+            nNode = np.where(data[0]!=0)[0]+1
+
+            width = []
+            for i in nNode:
+                if i%self.nnode_x == 0:
+                    width.append((self.node_x[-1]-self.node_x[-2])/2)
+                elif i%self.nnode_x == 1:
+                    width.append((self.node_x[1]-self.node_x[0])/2)
+                else:
+                    width.append((self.node_x[(i+1)%self.nnode_x]-self.node_x[(i-1)%self.nnode_x])/2)
+
+            nodes, mesh = self.GenerateMesh(self.node_x, self.node_z)
+            self.NodeOrder = None
+            if self.Renumber:
+                nodes, mesh = self.RenumberNodes(nodes, mesh)
+                data = [d[self.NodeOrder] for d in data]
+                nNode = self.NodeNumber(nNode)
+            self.NumNP = len(nodes)
+            self.NumEl = len(mesh)
+            self.NumBP = len(nNode)
+            self.MBan = self.BandWidth(mesh)
+            self.MeshHash = domain
+
+            for name in mesh_files:
+                if name == 'Meshtria.txt':
+                    self.write_Meshtria(nodes, mesh)
+                elif name == 'Domain.dat':
+                    self.write_Domain(data)
+                else:
+                    self.write_Boundary(nNode, width)
+                _written(name)
+
+        if _dirty('Selector.in'):
+            self.write_Selector(self.TPrint)
+            _written('Selector.in')
+
+        if _dirty('Atmosph.in'):
+            data = pd.read_excel(self.AtmFile, 0).to_numpy()
+            self.write_ATMOSPH(data)
+            _written('Atmosph.in')
+
+        if dimensio:
+            self.write_Dimensio()
+            _written('Dimensio.in')
+        return rewritten
+
     def _str2bool(self, line):
         if line == 't':
             return True
@@ -1072,20 +1625,21 @@ class HYDRUS2DSIMPLE_INIT:
             return False
             
     def read_Dimensio(self):
-        with open(self.path+'\\Dimensio.in', 'r') as f:
+        with open(os.path.join(self.path, 'Dimensio.in'), 'r') as f:
             line = f.readlines()[2].split()
-        key = ['NumNP', 'NumEl', 'NumBP', 'MBand', 'NSeep', 'NumSP', 
+        key = ['NumNP', 'NumEl', 'NumBP', 'MBan', 'NSeep', 'NumSP', 
                'NDr', 'NElDr', 'NMat', 'NObs', 'NS']
         flag = {key[i]:int(line[i]) for i in range(len(key))}
         self.__dict__.update(**flag)
     
     
     def read_Meshtria(self):
-        with open(self.path+'\\Meshtria.txt', 'r') as f:
+        with open(os.path.join(self.path, 'Meshtria.txt'), 'r') as f:
             MaxIter = int(f.readline().split()[1])
             coords = np.array([[float(line.split()[1]), float(line.split()[2])] 
                                for line in f.readlines()[:MaxIter]], dtype=float)
         
+        self.node_coords = coords
         self.node_x = np.unique(coords[:, 0])
         self.node_z = np.unique(coords[:, 1])
         self.min_x = np.min(self.node_x)
@@ -1095,9 +1649,16 @@ class HYDRUS2DSIMPLE_INIT:
         self.nnode_x = self.node_x.size
         self.nnode_z = self.node_z.size
 
+        #grid node of every node, the nodes were renumbered if it is not the identity
+        col = np.searchsorted(self.node_x, coords[:, 0])
+        row = self.nnode_z - 1 - np.searchsorted(self.node_z, coords[:, 1])
+        NodeOrder = row*self.nnode_x + col
+        self.Renumber = bool(np.any(NodeOrder != np.arange(NodeOrder.size)))
+        self.NodeOrder = NodeOrder if self.Renumber else None
+
     
     def read_Boundary(self):
-        with open(self.path+'\\Boundary.in', 'r') as f:
+        with open(os.path.join(self.path, 'Boundary.in'), 'r') as f:
             f.readline()
             f.readline()
             f.readline()
@@ -1175,6 +1736,8 @@ class HYDRUS2DSIMPLE_INIT:
                 for l in line:
                     Width.append(float(l))
             self.nNode, self.Width = np.array(nNode, dtype=int), np.array(Width, dtype=int)
+            if self.NumBP != 0:
+                self.nNode = self.GridNumber(self.nNode)
             
             f.readline()
             line = f.readline().split()
@@ -1183,7 +1746,7 @@ class HYDRUS2DSIMPLE_INIT:
             if self.NObs != 0:
                 f.readline()
                 line = f.readline().split()
-                self.Obs_nodes = [int(l) for l in line]
+                self.Obs_nodes = [int(l) for l in self.GridNumber([int(l) for l in line])]
             
             f.readline()
             line = f.readline().split()
@@ -1196,7 +1759,7 @@ class HYDRUS2DSIMPLE_INIT:
                 self.NDr, self.DrCorr = int(line[0]), int(line[1])
                 f.readline()
                 line = f.readline().split()
-                self.ND = [int(l) for l in line]
+                self.ND = [int(l) for l in self.GridNumber([int(l) for l in line])]
                 f.readline()
                 line = f.readline().split()                
                 self.NELD = [int(l) for l in line]
@@ -1232,7 +1795,7 @@ class HYDRUS2DSIMPLE_INIT:
                 self.KodTB = np.array(KodTB, dtype=int)
 
     def read_Selector(self):
-        with open(self.path+'\\Selector.in', 'r') as f:
+        with open(os.path.join(self.path, 'Selector.in'), 'r') as f:
             f.readline()
             f.readline()
             f.readline()
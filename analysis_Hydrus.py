@@ -43,7 +43,7 @@ Data = Hydrus1D.Obs_Node(CASENAME)
 time = Data.time
 for j, h in enumerate(Data.header[1:]):
         fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(8, 6))
-        for i in range(1, len(Data.nNode)//2):
+        for i in range(1, Data.node.size):
             ax=Data.plot(j, i, ax=ax)
 #        ax = Data.plot(j, ['50cm', '100cm', '150cm', '200cm', '250cm', '300cm', '400cm'])
 #        ax.set_xlim(1095, 1460)
@@ -51,13 +51,11 @@ for j, h in enumerate(Data.header[1:]):
 CASENAME = '../Final_sandy_Spring'
 Data = Hydrus1D.Obs_Node(CASENAME)
 
+#all nodes at once, (node, time) -> (node,)
+c_flux, mass = utils_Hydrus.C_flux(Data.time, Data.GetData(2)[:7], Data.GetData(3)[:7])
 for node in range(7):
-    flux = Data.GetData(2)[node]
-    conc = Data.GetData(3)[node]
-
-    c_flux, mass = utils_Hydrus.C_flux(Data.time, flux, conc)
     print('node:\t{}\tflux:\t{:.3e}\t[{M}/{T}]\tmass:\t{:.3e}\t[{M}/{L}.{T}]'
-          .format(Data.nNode[node*2+1], c_flux*10**6, mass,
+          .format(Data.node[node], c_flux[node]*10**6, mass[node],
                   M=Data.unit_M, L=Data.unit_L, T=Data.unit_T))
 
 # %% 5
@@ -153,7 +151,7 @@ ax = Data3.plot(3, label='2D')
 Data1.plot(11, ax=ax, label='1D')
 
 # %%
-Data3 = Hydrus2D.Balance(CASE3, 30*12)
+Data3 = Hydrus2D.Balance(CASE3)
 for j, h in enumerate(Data3.header):  
      Data3.plot(j)
 
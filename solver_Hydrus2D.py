@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import queue
+import shlex
+import shutil
+import hashlib
+import tempfile
+import argparse
+import threading
+from abc import ABC, abstractmethod
+import itertools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+
+SOLVER = 'H2D_Calc64.exe'
+
+
+class SolverBackend(ABC):
+    #how the solver is started for a project directory
+    @abstractmethod
+    def command(self, path):
+        pass
+
+    def identity(self):
+        #what the results depend on besides the inputs, part of the RunCache key
+        return type(self).__name__
+
+
+class ExecutableBackend(SolverBackend):
+    #solver executable, command line as a string or a list of arguments, the project directory is appended
+    def __init__(self, solver=SOLVER):
+        self.solver = solver
+
+    def command(self, path):
+        solver = self.solver
+        if isinstance(solver, str):
+            solver = shlex.split(solver, posix=(os.name != 'nt'))
+        return list(solver) + [path]
+
+    def identity(self):
+        #the executable by its name and its options, not where it is installed
+        command = self.command('')[:-1]
+        return ' '.join([type(self).__name__, os.path.basename(command[0])] + command[1:])
+
+
+class StandInBackend(SolverBackend):
+    #standin_Hydrus2D.py: writes synthetic output files of the requested size, runs anywhere Python does
+    def __init__(self, nTime=None, nPrintTime=None, NumNP=None, NObs=None, seed=0, seconds=0):
+        self.options = {'--times': nTime, '--print-times': nPrintTime, '--nodes': NumNP,
+                        '--obs-nodes': NObs, '--seed': seed, '--seconds': seconds}
+
+    def command(self, path):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'standin_Hydrus2D.py')
+        options = []
+        for key, value in self.options.items():
+            if value is not None:
+                options += [key, str(value)]
+        return [sys.executable, script] + options + [path]
+
+    def identity(self):
+        #the options that change the outputs (not --seconds)
+        return ' '.join([type(self).__name__] + ['{}={}'.format(k, v) for k, v in sorted(self.options.items())
+                                                 if k != '--seconds'])
+
+
+def solver_backend(solver):
+    #a SolverBackend, or the command line of an executable
+    return solver if isinstance(solver, SolverBackend) else ExecutableBackend(solver)
+
+
+class RunCache:
+    #solver results (the .out files of a project) stored under the hash of its input files and the solver,
+    #the least recently used results are removed when the cache grows beyond max_bytes
+    InputFiles = ('Selector.in', 'Boundary.in', 'Domain.dat', 'Meshtria.txt', 'Atmosph.in', 'Dimensio.in')
+
+    def __init__(self, root, max_bytes=10*2**30):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, path, solver=SOLVER):
+        h = hashlib.sha1()
+        h.update(solver_backend(solver).identity().encode())
+        for name in self.InputFiles:
+            filename = os.path.join(path, name)
+            h.update(name.encode())
+            if not os.path.isfile(filename):
+                h.update(b'-')
+                continue
+            h.update(b'+')
+            with open(filename, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+        return h.hexdigest()
+
+    def _outputs(self, path):
+        return [name for name in os.listdir(path)
+                if name.lower().endswith('.out') and os.path.isfile(os.path.join(path, name))]
+
+    def restore(self, path, key=None):
+        #copies the stored results into the project, False if there are none
+        entry = os.path.join(self.root, key or self.key(path))
+        #the lock only for the lookup, the results are copied while the other runs go on
+        with self.lock:
+            if not os.path.isdir(entry):
+                return False
+            os.utime(entry)
+        try:
+            for name in self._outputs(entry):
+                shutil.copyfile(os.path.join(entry, name), os.path.join(path, name))
+        except OSError:
+            #evicted meanwhile
+            return False
+        return True
+
+    def store(self, path, key=None):
+        entry = os.path.join(self.root, key or self.key(path))
+        temp = tempfile.mkdtemp(dir=self.root, prefix='.tmp')
+        for name in self._outputs(path):
+            shutil.copyfile(os.path.join(path, name), os.path.join(temp, name))
+        with self.lock:
+            try:
+                os.replace(temp, entry)
+            except OSError:
+                #stored meanwhile by another run of the same inputs
+                shutil.rmtree(temp, ignore_errors=True)
+            os.utime(entry)
+            self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.root):
+            entry = os.path.join(self.root, name)
+            if name.startswith('.tmp') or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+def run_project(path, solver=SOLVER, timeout=None, cache=None):
+    #runs the solver for one project directory,
+    #stdout/stderr are saved as Solver.out/Solver.err in the directory,
+    #with a RunCache the results of identical inputs are restored instead
+    path = os.path.abspath(path)
+    result = {'path': path, 'status': 'ok', 'returncode': None, 'seconds': 0.0,
+              'stdout': os.path.join(path, 'Solver.out'), 'stderr': os.path.join(path, 'Solver.err'),
+              'error': ''}
+    start = time.perf_counter()
+    if cache is not None:
+        key = cache.key(path, solver)
+        if cache.restore(path, key):
+            result['status'] = 'cached'
+            result['seconds'] = time.perf_counter() - start
+            return result
+    try:
+        with open(result['stdout'], 'wb') as out, open(result['stderr'], 'wb') as err:
+            #stdin is closed so that a pending "press Enter" (lEnter) does not block the run
+            proc = subprocess.run(solver_backend(solver).command(path), stdin=subprocess.DEVNULL,
+                                  stdout=out, stderr=err, timeout=timeout)
+        result['returncode'] = proc.returncode
+        if proc.returncode != 0:
+            result['status'] = 'failed'
+        elif cache is not None:
+            cache.store(path, key)
+    except subprocess.TimeoutExpired:
+        result['status'] = 'timeout'
+        result['error'] = 'no result after {} s'.format(timeout)
+    except OSError as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def parse_screen(line):
+    #one line of the solver's screen output (lScrn), None for headers and messages:
+    #  Time  ItW ... ItCum  vTop ...
+    tokens = line.split()
+    try:
+        time = float(tokens[0].replace('D', 'E'))
+    except (IndexError, ValueError):
+        return None
+    iterations = [int(t) for t in itertools.takewhile(str.isdigit, tokens[1:])]
+    if not iterations:
+        return None
+    return {'time': time, 'iterations': iterations[0], 'cumulative': iterations[-1]}
+
+
+class SolverRun(threading.Thread):
+    #runs the solver for one project in the background,
+    #the screen output is saved as Solver.out and its progress put in self.queue as
+    #('progress', {time, dt, iterations, cumulative}), then ('done', returncode) or ('error', message)
+    def __init__(self, path, solver=SOLVER):
+        threading.Thread.__init__(self, daemon=True)
+        self.path = os.path.abspath(path)
+        self.solver = solver
+        self.queue = queue.Queue()
+        self.proc = None
+        self.cancelled = False
+
+    def run(self):
+        try:
+            self.proc = subprocess.Popen(solver_backend(self.solver).command(self.path), stdin=subprocess.DEVNULL,
+                                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as e:
+            self.queue.put(('error', str(e)))
+            return
+        if self.cancelled:
+            self.proc.terminate()
+        time = None
+        with open(os.path.join(self.path, 'Solver.out'), 'wb') as log:
+            for line in self.proc.stdout:
+                log.write(line)
+                progress = parse_screen(line.decode(errors='replace'))
+                if progress is not None:
+                    progress['dt'] = None if time is None else progress['time'] - time
+                    time = progress['time']
+                    self.queue.put(('progress', progress))
+        self.queue.put(('done', self.proc.wait()))
+
+    def cancel(self):
+        self.cancelled = True
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+
+
+def run_batch(paths, solver=SOLVER, workers=None, timeout=None, summary=None, callback=None, cache=None):
+    #runs the solver for every project directory, at most `workers` solver processes at a time,
+    #returns the summary table (one row per project, in the order of paths) and writes it to `summary` (.csv)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    results = [None]*len(paths)
+    #the solvers are separate processes, the threads only wait for them
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_project, path, solver, timeout, cache): i for i, path in enumerate(paths)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if callback is not None:
+                callback(future.result())
+    table = pd.DataFrame(results, columns=['path', 'status', 'returncode', 'seconds',
+                                           'stdout', 'stderr', 'error'])
+    table['returncode'] = table['returncode'].astype('Int64')
+    if summary is not None:
+        table.to_csv(summary, index=False)
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the HYDRUS-2D solver for many project directories.')
+    parser.add_argument('paths', nargs='+', help='project directories')
+    parser.add_argument('--solver', default=SOLVER, help='solver command line, the project directory is appended')
+    parser.add_argument('--stand-in', action='store_true', help='run standin_Hydrus2D.py instead of the solver')
+    parser.add_argument('--workers', type=int, default=None, help='number of concurrent runs (default: number of CPUs)')
+    parser.add_argument('--timeout', type=float, default=None, help='time limit of one run [s]')
+    parser.add_argument('--summary', default='summary.csv', help='summary table (.csv)')
+    parser.add_argument('--cache', default=None, help='run cache directory, identical inputs are not run again')
+    parser.add_argument('--cache-size', type=float, default=10, help='size limit of the run cache [GB]')
+    args = parser.parse_args(argv)
+
+    def _report(result):
+        print('{status:>8} {seconds:8.1f} s  {path}'.format(**result))
+
+    cache = None if args.cache is None else RunCache(args.cache, int(args.cache_size*2**30))
+    solver = StandInBackend() if args.stand_in else args.solver
+    table = run_batch(args.paths, solver, args.workers, args.timeout, args.summary, _report, cache)
+    return int((~table['status'].isin(['ok', 'cached'])).any())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from HYDRUS_setting import HYDRUS2DSIMPLE_INIT
+
+
+class StandIn(HYDRUS2DSIMPLE_INIT):
+    #deterministic pure Python stand-in for H2D_Calc64.exe: reads the sizes from the project
+    #and writes synthetic output files in the formats read by utils_Hydrus1D/utils_Hydrus2D
+    def __init__(self, path, nTime=None, nPrintTime=None, NumNP=None, NObs=None, seed=0):
+        HYDRUS2DSIMPLE_INIT.__init__(self)
+        self.path = path
+        self.read_Dimensio()
+        self.read_Selector()
+        self.read_Boundary()
+        self.tInit, self.tMax = float(self.tInit), float(self.tMax)
+        self.TUnit = str(self.TUnit).strip()
+        self.LUnit = str(self.LUnit).strip()
+        self.Heading = str(self.Heading).strip()
+        if NumNP is not None:
+            self.NumNP = NumNP
+        if NObs is not None:
+            self.NObs = NObs
+            self.Obs_nodes = list(np.linspace(1, self.NumNP, NObs+2, dtype=int)[1:-1])
+        self.nPrintTime = int(self.MPL) if nPrintTime is None else nPrintTime
+        self.nTime = 100 if nTime is None else nTime
+        self.rng = np.random.default_rng(seed)
+
+        self.times = np.linspace(self.tInit, self.tMax, self.nTime+1)[1:]
+        self.print_times = np.linspace(self.tInit, self.tMax, self.nPrintTime+1)[1:]
+
+    def _preamble(self, version=True):
+        lines = [' FileVersion=0003'] if version else []
+        lines += [' {}'.format(self.Heading),
+                  ' ',
+                  ' Program HYDRUS2',
+                  ' Date: {:>3}.{:>2}.{:4}    Time: {:>3}:{:02d}:{:02d}'.format(18, 10, 2026, 0, 0, 0),
+                  ' Time independent boundary conditions',
+                  ' Vertical plane flow, V = L*L',
+                  ' Units: L = {:<5}, T = {:<5}, M = mmol '.format(self.LUnit, self.TUnit)]
+        return lines
+
+    def _series(self, ncol, scale=1.0):
+        #smooth seasonal signals with a little noise, one column per signal
+        t = self.times[:, None]
+        phase = self.rng.uniform(0, 2*np.pi, ncol)
+        noise = self.rng.normal(0, 0.05, (self.times.size, ncol))
+        return scale*(1 + 0.5*np.sin(2*np.pi*t/365 + phase) + noise)
+
+    def _write_series(self, filename, header, unit, data, preamble):
+        with open(os.path.join(self.path, filename), 'w') as f:
+            for line in preamble:
+                f.write(line+'\n')
+            f.write(''.join('{:>13}'.format(h) for h in header)+'\n')
+            f.write(''.join('{:>13}'.format(u) for u in unit)+'\n')
+            f.write(' \n')
+            np.savetxt(f, np.column_stack([self.times, data]), fmt='%13.4f'+'%13.4E'*data.shape[1], delimiter='')
+            f.write('end\n')
+
+    def write_T_Level(self):
+        header = ['Time', 'rTop', 'rRoot', 'vTop', 'vRoot', 'vBot', 'sum(rTop)', 'sum(rRoot)', 'sum(vTop)',
+                  'sum(vRoot)', 'sum(vBot)', 'hTop', 'hRoot', 'hBot', 'RunOff', 'sum(RunOff)', 'Volume',
+                  'sum(Infil)', 'sum(Evap)', 'TLevel', 'Cum(WTrans)', 'SnowLayer']
+        unit = ['[T]'] + ['[L/T]']*5 + ['[L]']*5 + ['[L]']*3 + ['[L/T]', '[L]', '[L]', '[L]', '[L]', '[-]', '[L]', '[L]']
+        rates = -0.1*self._series(5)
+        dt = np.diff(np.concatenate([[self.tInit], self.times]))[:, None]
+        heads = -100*self._series(3)
+        runoff = np.zeros((self.nTime, 2))
+        rest = np.column_stack([100 + np.cumsum(rates.sum(axis=1))*dt[:, 0]/5,
+                                np.cumsum(np.abs(rates[:, :2]), axis=0)*dt,
+                                np.arange(1, self.nTime+1), np.zeros(self.nTime), np.zeros(self.nTime)])
+        data = np.column_stack([rates, np.cumsum(rates*dt, axis=0), heads, runoff, rest])
+        self._write_series('T_Level.out', header, unit, data, self._preamble(version=False)[:6])
+
+    def write_v_Mean(self):
+        header = ['Time', 'rAtm', 'rRoot', 'vAtm', 'vRoot', 'vKode3', 'vKode1', 'vSeep', 'vKode5',
+                  'vKode6', 'vKode7', 'vKode8', 'vKode9', 'vDrain']
+        unit = ['[T]'] + ['[V/T]']*(len(header)-1)
+        self._write_series('v_Mean.out', header, unit, -0.1*self._series(len(header)-1),
+                           self._preamble()+[' ', ' '])
+
+    def write_Cum_Q(self):
+        header = ['Time', 'CumQAP', 'CumQRP', 'CumQA', 'CumQR', 'CumQ3', 'CumQ1', 'CumQS', 'CumQ5',
+                  'CumQ6', 'CumQ7', 'CumQ8', 'CumQ9', 'CumQDrain']
+        unit = ['[T]'] + ['[V]']*(len(header)-1)
+        dt = np.diff(np.concatenate([[self.tInit], self.times]))[:, None]
+        data = np.cumsum(-0.1*self._series(len(header)-1)*dt, axis=0)
+        self._write_series('Cum_Q.out', header, unit, data, self._preamble()+[' ', ' '])
+
+    def write_ObsNod(self):
+        nValues = 5
+        with open(os.path.join(self.path, 'ObsNod.out'), 'w') as f:
+            f.write(' \n \n Observation nodes:\n')
+            f.write(' '*13+''.join('{:>14}({:>5}){:>36}'.format('Node', n, '') for n in self.Obs_nodes)+'\n')
+            f.write(' \n')
+            f.write('{:>13}'.format('time')+'{:>11}{:>11}{:>11}{:>11}{:>11}'.format('h', 'theta', 'Temp', 'Conc', 'Sorb')*self.NObs+'\n')
+            data = [self.times[:, None]]
+            for _ in range(self.NObs):
+                data += [-100*self._series(1), 0.3*self._series(1), 20*self._series(1),
+                         self._series(1), 0.5*self._series(1)]
+            np.savetxt(f, np.column_stack(data), fmt='%13.4f'+'%11.4f'*(nValues*self.NObs), delimiter='')
+            f.write('end\n')
+
+    def write_Balance(self):
+        quantities = [('Area', '[L2]'), ('W-volume', '[L2]'), ('In-flow', '[L2/T]'), ('h Mean', '[L]'),
+                      ('Top Flux', '[L/T]'), ('Bot Flux', '[L/T]'), ('WatBalT', '[L2]'), ('WatBalR', '[%]'),
+                      ('ConcVol', '[M]'), ('cMean', '[M/L3]'), ('SinkC', '[M/T]'), ('CncBalT', '[M]'),
+                      ('CncBalR', '[%]')]
+        rule = ' '+'-'*78+'\n'
+        values = self.rng.normal(1, 0.05, (self.nPrintTime, len(quantities)))
+        with open(os.path.join(self.path, 'Balance.out'), 'w') as f:
+            f.write('\n'.join(self._preamble(version=False))+'\n')
+            blocks = []
+            for t, row in zip(self.print_times, values):
+                block = [rule, ' \n', rule, ' Time       [T]   {:>14.4f}\n'.format(t), rule,
+                         ' Sub-region num.                   1\n', rule]
+                block += ['{:<9}{:<7}   {:>13.4E}\n'.format(' '+name, unit, v) for (name, unit), v in zip(quantities, row)]
+                blocks.append(''.join(block))
+            f.write(''.join(blocks))
+            f.write(rule)
+            f.write(' Calculation time [sec]   {:>14.4f}\n'.format(0))
+
+    def _write_field(self, filename, field, nValues=1):
+        #binary: for every print time the time and nValues*NumNP nodal values as float32
+        depth = np.linspace(0, 1, self.NumNP, dtype=np.float32)
+        with open(os.path.join(self.path, filename), 'wb') as f:
+            for t in self.print_times:
+                record = np.empty(nValues*self.NumNP+1, dtype='<f4')
+                record[0] = t
+                for k in range(nValues):
+                    record[1+k*self.NumNP:1+(k+1)*self.NumNP] = field(t, depth)
+                record.tofile(f)
+
+    def write_h(self):
+        self._write_field('h.out', lambda t, depth: -100*(1 + depth*np.sin(2*np.pi*t/365))
+                          + self.rng.normal(0, 1, self.NumNP))
+
+    def write_th(self):
+        self._write_field('th.out', lambda t, depth: 0.3 + 0.05*depth*np.sin(2*np.pi*t/365)
+                          + self.rng.normal(0, 0.001, self.NumNP))
+
+    def write_v(self):
+        self._write_field('v.out', lambda t, depth: -0.1*(1 + 0.5*np.sin(2*np.pi*t/365))
+                          + self.rng.normal(0, 0.01, self.NumNP), nValues=2)
+
+    def write_Temp(self):
+        self._write_field('Temp.out', lambda t, depth: 20 + 5*(1 - depth)*np.sin(2*np.pi*t/365))
+
+    def write_Run_Info(self):
+        #time levels: dt grows by DMul after easy steps, a step without convergence is written with F
+        #and repeated at the same time level with dt/3 (at least dtMin)
+        dt, dtMin, dtMax = float(self.dt), float(self.dtMin), float(self.dtMax)
+        t, level, cumulative = self.tInit, 1, 0
+        row = '{:>8}{:13.4E}{:13.4E}{:>7}{:>8}{:>6}{:>6}{:>13}\n'
+        with open(os.path.join(self.path, 'Run_Info.out'), 'w') as f:
+            f.write(' Program HYDRUS2\n {}\n'.format(self.Heading))
+            f.write('{:>8}{:>13}{:>13}{:>7}{:>8}{:>6}{:>6}{:>13}\n'.format(
+                'TLevel', 'Time', 'dt', 'Iter', 'ItCum', 'KodT', 'KodB', 'Convergency'))
+            f.write(' \n')
+            while t < self.tMax:
+                dt = min(dt, self.tMax - t)
+                iterations = int(self.rng.geometric(0.25))
+                converged = iterations <= int(self.MaxIt)
+                iterations = min(iterations, int(self.MaxIt))
+                cumulative += iterations
+                if not converged and dt > dtMin:
+                    f.write(row.format(level, t+dt, dt, iterations, cumulative, -1, -1, 'F'))
+                    dt = max(dt/3, dtMin)
+                    continue
+                t += dt
+                f.write(row.format(level, t, dt, iterations, cumulative, -1, -1, 'T' if converged else 'F'))
+                level += 1
+                if iterations <= int(self.ItMin):
+                    dt = min(dt*float(self.DMul), dtMax)
+            f.write('end\n')
+            f.write(' Calculation time [sec]   {:>14.4f}\n'.format(0.001*cumulative))
+
+    def screen(self, seconds=0, lines=100):
+        #screen output (lScrn) for the progress display, spread over `seconds`
+        print('{:>13}{:>6}{:>8}{:>12}'.format('Time', 'ItW', 'ItCum', 'vTop'), flush=True)
+        cumulative = 0
+        for t in np.linspace(self.tInit, self.tMax, lines+1)[1:]:
+            iterations = int(self.rng.integers(1, 8))
+            cumulative += iterations
+            print('{:13.4E}{:>6}{:>8}{:12.3E}'.format(t, iterations, cumulative, -0.1), flush=True)
+            time.sleep(seconds/lines)
+
+    def run(self, seconds=0):
+        self.screen(seconds)
+        self.write_T_Level()
+        self.write_ObsNod()
+        self.write_Balance()
+        self.write_Cum_Q()
+        self.write_h()
+        self.write_th()
+        self.write_v()
+        self.write_Temp()
+        self.write_v_Mean()
+        self.write_Run_Info()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stand-in for H2D_Calc64.exe writing synthetic output files.')
+    parser.add_argument('path', help='project directory')
+    parser.add_argument('--times', type=int, default=None, help='rows of the time series files (default 100)')
+    parser.add_argument('--print-times', type=int, default=None, help='print times of h.out and Balance.out (default MPL)')
+    parser.add_argument('--nodes', type=int, default=None, help='number of nodes of h.out (default NumNP)')
+    parser.add_argument('--obs-nodes', type=int, default=None, help='number of observation nodes (default from Boundary.in)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--seconds', type=float, default=0, help='run time to simulate')
+    args = parser.parse_args(argv)
+    try:
+        standin = StandIn(args.path, args.times, args.print_times, args.nodes, args.obs_nodes, args.seed)
+    except (OSError, ValueError, IndexError) as e:
+        #as the solver: the error on the screen output and no output files
+        print('Error when reading the input files: {}'.format(e), flush=True)
+        return 1
+    standin.run(args.seconds)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
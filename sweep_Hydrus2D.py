@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import copy
+import shutil
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from HYDRUS_setting import HYDRUS2DSIMPLE_INIT
+
+
+def parameter_grid(grid):
+    #{name: [values, ...]} -> list of overrides, one per combination of values
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def apply_overrides(setup, overrides):
+    #overrides: attribute name -> value, with
+    #  'materials[i]': row of self.materials, or {column: value} to change some of its columns
+    #  'TPrint': print times, MPL follows
+    #  'AtmFile': atmospheric data set (.xlsx) for Atmosph.in
+    for name, value in overrides.items():
+        index = re.fullmatch(r'materials\[(\d+)\]', name)
+        if index is not None:
+            i = int(index.group(1))
+            if isinstance(value, dict):
+                header = setup.soil_Header[str(setup.Model)]
+                row = list(setup.materials[i])
+                for column, v in value.items():
+                    row[header.index(column)] = v
+                value = row
+            setup.materials[i] = list(value)
+        elif name not in setup.__dict__:
+            raise KeyError('unknown parameter {}'.format(name))
+        else:
+            setup.__dict__[name] = value
+            if name == 'TPrint':
+                setup.MPL = len(value) - 1
+    return setup
+
+
+def _copy_setup(base):
+    #parameters of the base setup only, so that a GUI instance can be used as base as well
+    setup = HYDRUS2DSIMPLE_INIT.__new__(HYDRUS2DSIMPLE_INIT)
+    names = HYDRUS2DSIMPLE_INIT().__dict__
+    setup.__dict__.update(copy.deepcopy({k: v for k, v in base.__dict__.items() if k in names}))
+    return setup
+
+
+def _link(source, target):
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def _write_variant(setup, files):
+    return setup.WriteInputs(force=True, files=files)
+
+
+def sweep(base, variants, root, names=None, workers=None):
+    #writes the input files of every variant of the base setup into root/<name>,
+    #variants: list of overrides or a grid {name: [values, ...]} (see parameter_grid),
+    #files that come out identical for several variants are written once and hardlinked,
+    #a variant written again later gets its own files (the writers replace, see HYDRUS2DSIMPLE_INIT._replace),
+    #returns the table of the variants (name, path and overrides), also saved as root/sweep.csv
+    if isinstance(variants, dict):
+        variants = parameter_grid(variants)
+    if names is None:
+        names = ['variant_{:03d}'.format(i+1) for i in range(len(variants))]
+    domain_file = base.DomainFile()
+
+    setups = []
+    for name, overrides in zip(names, variants):
+        setup = apply_overrides(_copy_setup(base), copy.deepcopy(overrides))
+        setup.path = os.path.abspath(os.path.join(root, name))
+        os.makedirs(setup.path, exist_ok=True)
+        #a copy, the variants may change their domain without touching the base project
+        shutil.copyfile(domain_file, os.path.join(setup.path, os.path.basename(domain_file)))
+        setups.append(setup)
+
+    #the first variant with a given hash writes the file, the others link to it
+    owner = {}
+    files = [[] for _ in setups]
+    links = []
+    for i, setup in enumerate(setups):
+        for filename, key in setup.InputKeys().items():
+            if (filename, key) in owner:
+                links.append((owner[filename, key], i, filename))
+            else:
+                owner[filename, key] = i
+                files[i].append(filename)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = [pool.submit(_write_variant, setups[i], files[i]) for i in range(len(setups)) if files[i]]
+        for job in jobs:
+            job.result()
+    for i, j, filename in links:
+        _link(os.path.join(setups[i].path, filename), os.path.join(setups[j].path, filename))
+
+    table = pd.DataFrame([{'name': name, 'path': setup.path,
+                           **{k: (v if np.ndim(v) == 0 else str(v)) for k, v in overrides.items()}}
+                          for name, setup, overrides in zip(names, setups, variants)])
+    table.to_csv(os.path.join(root, 'sweep.csv'), index=False)
+    return table
@@ -5,10 +5,260 @@ Created on Mon Jan  9 00:02:48 2023
 @author: toru1
 """
 import os
+import re
+import json
+import mmap
+import tempfile
+import functools
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
 
+_POW10 = 10.0**np.arange(23)
+
+
+def _fixed_layout(row):
+    #fields of a fixed format row (right aligned, as written by HYDRUS) and the columns of their characters:
+    #lead (blank, sign or digit), digit, point, letter/esign (exponent) and the digit columns by power of ten
+    chars = np.frombuffer(row, np.uint8)
+    ends = np.flatnonzero(np.diff(np.concatenate([[0], (chars != 32).astype(np.int8), [0]])))[1::2]
+    layout = {'nfield': ends.size, 'lead': [], 'field': [], 'pairs': [], 'digit': [], 'point': [],
+              'letter': [], 'esign': [], 'efield': [], 'ndec': np.zeros(ends.size, np.int64),
+              'mant': {}, 'expo': {}}
+    start = 0
+    for i, end in enumerate(ends):
+        text = row[start:end].upper().replace(b'D', b'E')
+        pe = text.find(b'E')
+        stop = len(text) if pe < 0 else pe
+        pd = text.find(b'.', 0, stop)
+        lead = range(start, start+(stop-1 if pd < 0 else pd))
+        layout['lead'] += lead
+        layout['field'] += [i]*len(lead)
+        layout['pairs'] += lead[1:]
+        if pd < 0:
+            layout['digit'].append(start+stop-1)
+        else:
+            layout['point'].append(start+pd)
+            layout['digit'] += range(start+pd+1, start+stop)
+            layout['ndec'][i] = stop-pd-1
+        columns = [start+j for j in range(stop-1, -1, -1) if j != pd]
+        if len(columns) > 15:
+            #more digits than a double holds exactly
+            return None
+        for k, j in enumerate(columns):
+            layout['mant'].setdefault(k, ([], []))
+            layout['mant'][k][0].append(j)
+            layout['mant'][k][1].append(i)
+        if pe >= 0:
+            if len(text) < pe+3 or text[pe+1:pe+2] not in (b'+', b'-'):
+                return None
+            layout['letter'].append(start+pe)
+            layout['esign'].append(start+pe+1)
+            layout['efield'].append(i)
+            layout['digit'] += range(start+pe+2, end)
+            for k, j in enumerate(range(end-1, start+pe+1, -1)):
+                layout['expo'].setdefault(k, ([], []))
+                layout['expo'][k][0].append(j)
+                layout['expo'][k][1].append(len(layout['efield'])-1)
+        start = end
+    for key in ('lead', 'field', 'pairs', 'digit', 'point', 'letter', 'esign', 'efield'):
+        layout[key] = np.array(layout[key], np.intp)
+    return layout
+
+
+def _parse_fixed(buffer, end=None, chunk=4096):
+    #rows of numbers (buffer[:end], one per line) -> float64 array, None if they are not of one fixed format,
+    #the characters of a block of rows are converted column by column, i.e. for all rows at once,
+    #rows that do not match the format of the first row are converted one by one
+    end = len(buffer) if end is None else end
+    width = buffer.find(b'\n', 0, end) + 1
+    if width <= 1 or end % width:
+        return None
+    content = width - 1 - (buffer[width-2:width-1] == b'\r')
+    layout = _fixed_layout(bytes(buffer[:content]))
+    if layout is None or layout['nfield'] == 0:
+        return None
+    nfield = layout['nfield']
+    lead, pairs, digit = layout['lead'], layout['pairs'], layout['digit']
+    point, letter, esign, efield = layout['point'], layout['letter'], layout['esign'], layout['efield']
+    #the fields with a digit of the given power of ten, all fields as a slice (no copy)
+    mant = [(np.array(columns), slice(None) if len(fields) == nfield else np.array(fields))
+            for columns, fields in layout['mant'].values()]
+    expo = [(np.array(columns), np.array(fields)) for columns, fields in layout['expo'].values()]
+    power = [_POW10[k] for k in layout['mant']]
+    lines = np.frombuffer(buffer, np.uint8, count=end).reshape(-1, width)
+    data = np.empty((lines.shape[0], nfield))
+    for a in range(0, lines.shape[0], chunk):
+        c = np.ascontiguousarray(lines[a:a+chunk].T)
+        if (c[-1] != 10).any():
+            return None
+        n = c.shape[1]
+        d = c - np.uint8(48)
+        ok = (c[content:-1] == 13).all(axis=0)
+        ok &= (d[digit] < 10).all(axis=0)
+        ok &= (c[point] == 46).all(axis=0)
+        e = c[letter] | np.uint8(32)
+        ok &= ((e == 101) | (e == 100)).all(axis=0)
+        s = c[esign]
+        ok &= ((s == 43) | (s == 45)).all(axis=0)
+        l = c[lead]
+        ok &= ((d[lead] < 10) | (l == 32) | (l == 43) | (l == 45)).all(axis=0)
+        #nothing but digits after the first digit or sign of a field
+        ok &= ~((c[pairs-1] != 32) & (d[pairs] >= 10)).any(axis=0)
+
+        m = np.zeros((nfield, n))
+        negative = np.zeros((nfield, n), bool)
+        for (columns, fields), p in zip(mant, power):
+            x = d[columns]
+            negative[fields] |= x == 253
+            x *= x < 10
+            m[fields] += x*p
+        scale = np.repeat(-layout['ndec'][:, None], n, axis=1)
+        if efield.size:
+            e = np.zeros((efield.size, n), np.int64)
+            for k, (columns, fields) in enumerate(expo):
+                e[fields] += d[columns]*np.int64(10**k)
+            e[s == 45] *= -1
+            scale[efield] += e
+        ok &= (np.abs(scale) <= 22).all(axis=0)
+        #mantissa and power of ten are exact doubles, so one rounding as in float()
+        p = _POW10[np.minimum(np.abs(scale), 22)]
+        v = np.multiply(m, p, where=scale >= 0, out=np.empty_like(m))
+        np.divide(m, p, where=scale < 0, out=v)
+        np.negative(v, where=negative, out=v)
+        v = v.T
+        for i in np.flatnonzero(~ok):
+            row = bytes(lines[a+i]).split()
+            if len(row) != nfield:
+                return None
+            v[i] = np.array(row, dtype=float)
+        data[a:a+n] = v
+    return data
+
+
+def _parse_table(rows):
+    #lines of numbers (bytes) -> float64 array
+    if not rows.endswith(b'\n'):
+        rows += b'\n'
+    data = _parse_fixed(rows)
+    if data is None:
+        data = np.array([line.split() for line in rows.decode().split("\n")[:-1]], dtype=float)
+    return data
+
+
+def _time_value(m):
+    return float(m.group(1).replace(b'D', b'E').replace(b'd', b'e'))
+
+
+_BALANCE_TIME = re.compile(r' *Time *\[(.*?)\] *(\S+)')
+_BALANCE_SUB = re.compile(r' *Sub-region num\. *(.*)')
+_BALANCE_ROW = re.compile(r' *(\S.*?) *\[(.*?)\] *(.*?) *$')
+_TIME = re.compile(rb'(?m)^ *Time:? +([-+.0-9EeDd]+)')
+_NUMBER = re.compile(rb' *[-+]?\.?[0-9]')
+
+
+def _end_line(buffer, end):
+    #start of the line "end" that closes the data of a time series in buffer[:end], -1 if there is none
+    i = buffer.find(b'end', 0, end)
+    while i >= 0 and buffer[buffer.rfind(b'\n', 0, i)+1:i].strip():
+        i = buffer.find(b'end', i+3, end)
+    return -1 if i < 0 else buffer.rfind(b'\n', 0, i)+1
+
+
+def _data_span(buffer, pos):
+    #the numeric lines following pos, up to the first other line after them: (start, end, number of lines)
+    start = end = pos
+    n = 0
+    while pos < len(buffer):
+        eol = buffer.find(b'\n', pos) + 1 or len(buffer)
+        if _NUMBER.match(buffer, pos, eol):
+            if start == end:
+                start = pos
+            end = eol
+            n += 1
+        elif start != end or _TIME.match(buffer, pos):
+            break
+        pos = eol
+    return start, end, n
+
+
+def _time_blocks(buffer):
+    #print-time blocks of nodal output: a line "Time: t", header lines and one line per node
+    #-> times and (start, end, number) of the node lines of every block,
+    #once the layout of a block repeats, the next block is expected at the same distance and only searched for otherwise
+    times, spans, marks = [], [], []
+    m = _TIME.search(buffer)
+    regular = False
+    while m is not None:
+        times.append(_time_value(m))
+        if regular:
+            shift = m.start() - marks[-1]
+            spans.append((spans[-1][0]+shift, spans[-1][1]+shift, spans[-1][2]))
+        else:
+            spans.append(_data_span(buffer, buffer.find(b'\n', m.end()) + 1 or len(buffer)))
+        marks.append(m.start())
+        regular = (len(marks) >= 2 and spans[-1][0]-marks[-1] == spans[-2][0]-marks[-2]
+                   and spans[-1][1]-spans[-1][0] == spans[-2][1]-spans[-2][0])
+        m = None
+        if regular:
+            m = _TIME.match(buffer, 2*marks[-1]-marks[-2])
+        if m is None:
+            regular = False
+            m = _TIME.search(buffer, spans[-1][1])
+    return times, spans
+
+
+def _savez(path, **arrays):
+    #np.savez into a file of its own in the same directory, moved to path when complete,
+    #so readers never see a partly written file and two writers never share one
+    fd, temp = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temp, path)
+    except BaseException:
+        _remove(temp)
+        raise
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class BlockView:
+    #print-time blocks of a text output file (see GetLines.blockIndex), read only when they are indexed:
+    #view[i] -> (nnode, ncol), view[i:j:k] or view[[i, j, ...]] -> (n, nnode, ncol)
+    def __init__(self, path, index):
+        self.path = path
+        self.time = index['time']
+        self.start = index['start']
+        self.end = index['end']
+
+    def __len__(self):
+        return self.time.size
+
+    def __getitem__(self, key):
+        rows = np.arange(len(self))[key]
+        if not np.size(rows):
+            return np.empty(np.shape(rows)+(0, 0))
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            data = _parse_table(b''.join(buffer[a:b] for a, b in zip(self.start[rows].flat, self.end[rows].flat)))
+        return data.reshape(*np.shape(rows), -1, data.shape[-1])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
 class GetLines:
+    #parsed results are kept next to the output file (see loadCache), False: always parse,
+    #cacheVersion: format of the cached attributes, increased when a reader changes them
+    cache = True
+    cacheVersion = 1
+
     def __init__(self):
         self.FileName = None
         self.CASENAME = None
@@ -21,7 +271,8 @@ class GetLines:
         self.UnitLine = 0
         self.DataLine = 0
 
-    def fopen(self):
+    def fopen(self, nlines=None):
+        #nlines: only the first nlines lines after skiplines, the data are read by readData
         self.unit_L = 'cm'
         self.unit_T = 'day'
         self.unit_M = 'g'
@@ -29,9 +280,81 @@ class GetLines:
         self.path = os.path.join('.', self.CASENAME, self.FileName)
 
         with open(self.path) as f:
-            lines = f.read().split("\n")
+            if nlines is None:
+                lines = f.read().split("\n")
+            else:
+                lines = [f.readline().rstrip("\n") for _ in range(self.skiplines+nlines)]
         self.lines = lines[self.skiplines:]
     
+    def _cacheFiles(self):
+        #the files the parsed results depend on
+        return [self.path]
+
+    def _cacheKey(self):
+        #the reader and its format version, the size and modification time of every file it reads
+        key = ['{} {}'.format(type(self).__name__, self.cacheVersion)]
+        for path in self._cacheFiles():
+            try:
+                stat = os.stat(path)
+                key.append('{} {} {}'.format(os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                key.append('{} -'.format(os.path.basename(path)))
+        return ', '.join(key)
+
+    def loadCache(self):
+        #the attributes of an earlier read of the file from <file>.cache.npz (arrays, the others as JSON),
+        #False if there is none or the reader or one of its files changed since (see _cacheKey)
+        self.fopen(0)
+        self._parameters = set(self.__dict__)
+        if not self.cache:
+            return False
+        sidecar = self.path+'.cache.npz'
+        try:
+            with np.load(sidecar) as cached:
+                meta = json.loads(str(cached['__meta__']))
+                if meta['key'] != self._cacheKey():
+                    return False
+                arrays = {name: cached[name] for name in cached.files if name != '__meta__'}
+            for name, n in meta['lists'].items():
+                arrays[name] = [arrays.pop('{}.{}'.format(name, i)) for i in range(n)]
+            attributes = dict(meta['attributes'])
+        except FileNotFoundError:
+            return False
+        except Exception:
+            #unreadable (truncated, BadZipFile, EOFError, ...): parsed again and written anew
+            _remove(sidecar)
+            return False
+        self.__dict__.update(attributes)
+        self.__dict__.update(arrays)
+        return True
+
+    def saveCache(self):
+        #the attributes set since loadCache into <file>.cache.npz
+        if not self.cache:
+            return
+        arrays, attributes, lists = {}, {}, {}
+        for name, value in self.__dict__.items():
+            if name in self._parameters or name.startswith('_'):
+                continue
+            if type(value) is np.ndarray:
+                arrays[name] = value
+            elif isinstance(value, list) and value and all(type(v) is np.ndarray for v in value):
+                lists[name] = len(value)
+                arrays.update({'{}.{}'.format(name, i): v for i, v in enumerate(value)})
+            elif isinstance(value, range):
+                attributes[name] = list(value)
+            else:
+                attributes[name] = value
+        try:
+            meta = json.dumps({'key': self._cacheKey(), 'attributes': attributes, 'lists': lists})
+        except TypeError:
+            #e.g. a BlockView (lazy), nothing is kept
+            return
+        try:
+            _savez(self.path+'.cache.npz', __meta__=np.array(meta), **arrays)
+        except OSError:
+            pass
+
     def readHeader(self):
         self.header = self.lines[self.HeaderLine].split()
         unit = self.lines[self.UnitLine].split()
@@ -40,9 +363,193 @@ class GetLines:
                      .replace('M', self.unit_M) for s in unit]
 
     def readData(self):
-        self.data = np.array([line.split() for line in self.lines[self.DataLine:-2]], dtype=float)
-        self.time =  self.data[:, 0]
-    
+        #the data lines up to the last line ("end") straight from the file, see _parse_fixed
+        with open(self.path, 'rb') as f:
+            for _ in range(self.skiplines+self.DataLine):
+                f.readline()
+            buffer = f.read()
+        #as lines[DataLine:-2]: without the last line and the one after the final newline
+        end = buffer.rfind(b'\n', 0, max(buffer.rfind(b'\n'), 0)) + 1
+        data = _parse_fixed(buffer, end)
+        if data is None:
+            data = np.array([line.split() for line in buffer[:end].decode().split("\n")[:-1]], dtype=float)
+        if data.ndim < 2:
+            #no data lines yet (a running simulation, see follow)
+            data = data.reshape(0, 0)
+        self._setTable(data)
+
+    def _setTable(self, table):
+        #data and time from the data lines (rows, columns), for observation nodes (see readObsNodes)
+        #data (ntime, nnode, nValues)
+        self.time = table[:, 0] if table.shape[1] else np.empty(0)
+        self.data = table
+        if getattr(self, 'nValues', None):
+            self.data = table[:, 1:].reshape(table.shape[0], -1 if table.size else self.node.size, self.nValues)
+
+    def follow(self):
+        #follow mode for a file that is still being written (T_Level.out, ObsNod.out, Cum_Q.out, ... of a
+        #running simulation): data and time start empty and grow with every poll()
+        self._offset = None
+        self._table = np.empty((0, 0))
+        self._nrows = 0
+        self.finished = False
+        self._setTable(self._table)
+        return self
+
+    def _dataOffset(self):
+        #byte offset of the first data line, None while the lines before it are not complete
+        with open(self.path, 'rb') as f:
+            for _ in range(self.skiplines+self.DataLine):
+                if not f.readline().endswith(b'\n'):
+                    return None
+            return f.tell()
+
+    def poll(self):
+        #follow mode: the complete rows appended since the last poll are read from the kept file offset
+        #and added to data and time, returns their number, finished once the line "end" is reached
+        if self._offset is None:
+            self._offset = self._dataOffset()
+        if self.finished or self._offset is None:
+            return 0
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            buffer = f.read()
+        #a row being written (no newline yet) is left for the next poll
+        end = buffer.rfind(b'\n') + 1
+        stop = _end_line(buffer, end)
+        if stop >= 0:
+            self.finished = True
+            end = stop
+        self._offset += end
+        if not buffer[:end].strip():
+            return 0
+        rows = _parse_table(buffer[:end])
+        if self._nrows and rows.shape[1] != self._table.shape[1]:
+            raise ValueError('rows of {} columns appended to {} in {}'.format(
+                rows.shape[1], self._table.shape[1], self.path))
+        n = self._nrows + rows.shape[0]
+        if n > self._table.shape[0]:
+            #the capacity is doubled, so that every row is copied only a few times
+            table = np.empty((max(n, 2*self._table.shape[0]), rows.shape[1]))
+            if self._nrows:
+                table[:self._nrows] = self._table[:self._nrows]
+            self._table = table
+        self._table[self._nrows:n] = rows
+        self._nrows = n
+        self._setTable(self._table[:n])
+        return rows.shape[0]
+
+    def blockIndex(self):
+        #times and byte offsets of the print-time blocks, kept next to the file as <file>.idx.npz
+        #and built again (see _time_blocks) when the size or modification time of the file changed
+        stat = os.stat(self.path)
+        key = np.array([stat.st_size, stat.st_mtime_ns])
+        sidecar = self.path+'.idx.npz'
+        try:
+            with np.load(sidecar) as index:
+                if np.array_equal(index['key'], key):
+                    return {name: index[name] for name in ('time', 'start', 'end', 'n')}
+        except FileNotFoundError:
+            pass
+        except Exception:
+            #unreadable, built again below
+            _remove(sidecar)
+        times, spans = [], []
+        if stat.st_size:
+            with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                times, spans = _time_blocks(buffer)
+        spans = np.array(spans, dtype=np.int64).reshape(-1, 3)
+        index = {'time': np.array(times, dtype=float), 'start': spans[:, 0], 'end': spans[:, 1], 'n': spans[:, 2]}
+        try:
+            _savez(sidecar, key=key, **index)
+        except OSError:
+            #read-only case directory, the index is built again next time
+            pass
+        return index
+
+    def readObsNodes(self, nValues):
+        #observation nodes: the time and nValues columns per node -> data (ntime, nnode, nValues),
+        #node the numbers of the nodes from "Node(  12)" of the first line
+        self.node = np.array(re.findall(r'Node\s*\(\s*(\d+)\s*\)', self.lines[0]), dtype=int)
+        self.nValues = nValues
+        self.readData()
+        self.time = self.time.copy()
+        self.data = np.ascontiguousarray(self.data)
+        self.header = self.lines[self.HeaderLine].split()[:nValues+1]
+
+    def readBlocks(self, lazy=False):
+        #nodal output: data of all print times as (nPrintTime, nnode, ncol), the node lines of
+        #all blocks are joined into one buffer and converted at once (see _time_blocks, _parse_fixed),
+        #lazy: a BlockView instead, which reads the print times only when they are indexed
+        index = self.blockIndex()
+        if not index['time'].size:
+            raise ValueError('no print times in {}'.format(self.path))
+        if np.unique(index['n']).size > 1:
+            raise ValueError('print times with different numbers of nodes in {}'.format(self.path))
+        view = BlockView(self.path, index)
+        self.time = view.time
+        self.nPrintTime = len(view)
+        self.data = view if lazy else view[:]
+        self.nnode = int(index['n'][0])
+
+    def iterBlocks(self, start=None, stop=None, step=None):
+        #nodal output one print time at a time: (time, block (nnode, ncol)),
+        #a lazy BlockView reads each block from the file as it is needed
+        for i in range(*slice(start, stop, step).indices(self.nPrintTime)):
+            yield self.time[i], self.data[i]
+
+    def readBalance(self):
+        #Balance.out in one pass: blocks of "Time [T] t", "Sub-region num. 1 2 ..." and one line
+        #"name [unit] value ..." per quantity -> data (nPrintTime, nquantity, nsubregion),
+        #NaN where a quantity has fewer values than sub-regions (e.g. WatBalT)
+        times, blocks, units = [], [], {}
+        self.subregion = []
+        self.CalcTime = None
+        block = None
+        with open(self.path) as f:
+            for line in f:
+                m = _BALANCE_TIME.match(line)
+                if m is not None:
+                    block = {}
+                    blocks.append(block)
+                    times.append(float(m.group(2)))
+                    continue
+                if block is None:
+                    continue
+                m = _BALANCE_SUB.match(line)
+                if m is not None:
+                    if len(m.group(1).split()) > len(self.subregion):
+                        self.subregion = m.group(1).split()
+                    continue
+                m = _BALANCE_ROW.match(line)
+                if m is None:
+                    continue
+                name, unit, values = m.groups()
+                try:
+                    values = [float(v) for v in values.split()]
+                except ValueError:
+                    continue
+                if name.startswith('Calculation time'):
+                    self.CalcTime = values[0] if values else None
+                    block = None
+                    continue
+                block[name] = values
+                units.setdefault(name, '['+unit+']')
+
+        self.header = list(units)
+        self.unit = [s.replace('L', self.unit_L)
+                     .replace('T', self.unit_T)
+                     .replace('M', self.unit_M)
+                     .replace('V', self.unit_V) for s in units.values()]
+        column = {name: j for j, name in enumerate(self.header)}
+        nsub = max([len(v) for b in blocks for v in b.values()] + [len(self.subregion), 1])
+        self.data = np.full((len(blocks), len(self.header), nsub), np.nan)
+        for i, b in enumerate(blocks):
+            for name, values in b.items():
+                self.data[i, column[name], :len(values)] = values
+        self.time = np.array(times)
+        self.nPrintTime = len(times)
+
     def plot(self, j, timemax=None, ax=None, label=None):
         if ax==None:
             fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(8, 6))
@@ -65,13 +572,228 @@ class GetLines:
     def GetData(self, j):
         return self.data[:, j]
 
-def C_flux(time, J, C):
-    nominator = np.trapz(J*C, x=time)
-    denominator = np.trapz(J, x=time)
+    def Resample(self, start, freq='M', q=(25, 50, 75)):
+        #data per calendar period (see Resampled), start: date of time 0 (e.g. '2020-01-01')
+        resampled = Resampled(self.time, self.data, start, freq, self.unit_T, q)
+        resampled.header = self.header
+        resampled.unit = getattr(self, 'unit', None)
+        return resampled
+
+def _load_case(reader, case):
+    return reader(case)
+
+
+class MultiCase:
+    #the same output of several cases: data (ncase, ntime, ...) on the print times of all cases,
+    #NaN where a case has no value at a time, observation nodes (nValues): data (ncase, ntime, node, value)
+    def __init__(self, cases, outputs):
+        self.cases = list(cases)
+        self.outputs = outputs
+        self.header = outputs[0].header
+        self.nValues = getattr(outputs[0], 'nValues', None)
+        self.unit = getattr(outputs[0], 'unit', None)
+        self.unit_T = outputs[0].unit_T
+        shapes = set(np.shape(o.data)[1:] for o in outputs)
+        if len(shapes) > 1:
+            raise ValueError('the outputs of the cases differ in shape: {}'.format(sorted(shapes)))
+        shape = shapes.pop()
+        times = [np.asarray(o.time, dtype=float) for o in outputs]
+        if all(np.array_equal(t, times[0]) for t in times):
+            self.time = times[0]
+            self.data = np.stack([np.asarray(o.data, dtype=float) for o in outputs])
+        else:
+            self.time = np.unique(np.concatenate(times))
+            self.data = np.full((len(outputs), self.time.size)+shape, np.nan)
+            for i, (o, t) in enumerate(zip(outputs, times)):
+                self.data[i, np.searchsorted(self.time, t)] = o.data
+
+    def GetData(self, j):
+        #observation nodes: value j as (case, node, time), the layout of their GetData
+        if self.nValues:
+            return self.data[..., j].transpose(0, 2, 1)
+        return self.data[:, :, j]
+
+    def plot(self, j, ax=None, labels=None, i=0):
+        #i: the node of observation node outputs
+        if ax==None:
+            fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(8, 6))
+        data = self.data[:, :, i, j] if self.nValues else self.data[:, :, j]
+        for label, values in zip(labels or self.cases, data):
+            valid = ~np.isnan(values)
+            ax.plot(self.time[valid], values[valid], label=label)
+        if self.nValues:
+            #the header of observation nodes starts with the time
+            ax.set_ylabel(self.header[j+1])
+        else:
+            try:
+                ax.set_ylabel(self.header[j]+' '+self.unit[j])
+            except:
+                ax.set_ylabel(self.header[j])
+        ax.set_xlabel('Time [{}]'.format(self.unit_T))
+        ax.legend()
+        return ax
+
+
+def LoadCases(reader, cases, workers=None, **kwargs):
+    #the same output of several cases read in parallel processes -> MultiCase,
+    #reader: a class of utils_Hydrus1D/utils_Hydrus2D (e.g. T_Level), kwargs are passed on to it
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        outputs = list(pool.map(_load_case, [functools.partial(reader, **kwargs)]*len(cases), cases))
+    return MultiCase(cases, outputs)
+
+
+#seconds per time unit (TUnit of Selector.in, by its first three letters)
+_SECONDS = {'sec': 1, 'min': 60, 'hou': 3600, 'day': 86400, 'yea': 365*86400}
+
+
+def _cumtrapz(y, time):
+    #cumulative trapezoid integral of y (..., ntime) over time (ntime,), 0 at time[0]
+    F = np.zeros(y.shape)
+    np.cumsum(0.5*(y[..., 1:] + y[..., :-1])*np.diff(time), axis=-1, out=F[..., 1:])
+    return F
+
+
+def _integral_at(F, y, time, t):
+    #integral from time[0] to t (nwindow,) of the piecewise linear y with cumulative integral F,
+    #t is limited to the time of the record
+    t = np.clip(t, time[0], time[-1])
+    i = np.clip(np.searchsorted(time, t, side='right') - 1, 0, time.size-2)
+    dt = t - time[i]
+    step = time[i+1] - time[i]
+    w = np.divide(dt, step, out=np.zeros_like(dt), where=step > 0)
+    y0 = y[..., i]
+    return F[..., i] + 0.5*dt*(2*y0 + w*(y[..., i+1] - y0))
+
+
+def _dates(time, start, unit):
+    #time of the outputs (unit: TUnit, e.g. 'days') -> datetime64[s] from the date of time 0
+    seconds = _SECONDS[unit[:3].lower()]
+    return np.datetime64(start, 's') + np.round(np.asarray(time, dtype=float)*seconds).astype('timedelta64[s]')
+
+
+def _times(dates, start, unit):
+    return (dates.astype('datetime64[s]') - np.datetime64(start, 's'))/np.timedelta64(1, 's')/_SECONDS[unit[:3].lower()]
+
+
+def _period_ids(dates, freq):
+    #number of the calendar period of every date: days, months or years since 1970 (freq 'D', 'M', 'Y'),
+    #freq 'S': meteorological seasons, December with January and February of the next year
+    if freq == 'S':
+        return (dates.astype('datetime64[M]').astype(np.int64) + 1)//3
+    return dates.astype('datetime64['+freq+']').astype(np.int64)
+
+
+def _period_start(ids, freq):
+    if freq == 'S':
+        return (3*ids - 1).astype('datetime64[M]')
+    return ids.astype('datetime64['+freq+']')
+
+
+def SlidingWindows(time, width, step=None):
+    #(start, end) of windows of the given width every step (default: width) within time -> (nwindow, 2)
+    step = width if step is None else step
+    n = int(np.floor((time[-1] - time[0] - width)/step + 1e-9)) + 1
+    start = time[0] + step*np.arange(max(n, 0))
+    return np.column_stack([start, start+width])
+
+
+def CalendarWindows(time, start, freq='M', unit='days'):
+    #(start, end) of the calendar periods (freq 'D', 'M', 'Y' or 'S', see _period_ids) that time covers
+    #-> (nwindow, 2), and the first day of every period; start: date of time 0 (e.g. '2020-01-01'), unit: TUnit
+    ids = _period_ids(_dates([time[0], time[-1]], start, unit), freq)
+    periods = _period_start(np.arange(ids[0], ids[1]+2), freq)
+    edges = _times(periods, start, unit)
+    return np.column_stack([edges[:-1], edges[1:]]), periods[:-1].astype('datetime64[D]')
+
+
+def C_flux(time, J, C, windows=None):
+    #flux-weighted concentration int(J*C)/int(J) and mass int(J*C) (trapezoid rule),
+    #J and C (..., ntime), e.g. (case, node, time), time (ntime,),
+    #windows: (start, end) times (nwindow, 2) -> results (..., nwindow), see SlidingWindows, CalendarWindows,
+    #every window is taken from the cumulative integrals, i.e. at the same cost
+    time = np.asarray(time, dtype=float)
+    J, C = np.broadcast_arrays(np.asarray(J, dtype=float), np.asarray(C, dtype=float))
+    JC = J*C
+    FJ = _cumtrapz(J, time)
+    FJC = _cumtrapz(JC, time)
+    if windows is None:
+        nominator = FJC[..., -1]
+        denominator = FJ[..., -1]
+    else:
+        windows = np.asarray(windows, dtype=float).reshape(-1, 2)
+        nominator = _integral_at(FJC, JC, time, windows[:, 1]) - _integral_at(FJC, JC, time, windows[:, 0])
+        denominator = _integral_at(FJ, J, time, windows[:, 1]) - _integral_at(FJ, J, time, windows[:, 0])
     c_flux = nominator / denominator
     return c_flux, nominator
 
 
+class Resampled:
+    #rows of data (ntime, ...) per calendar period (freq 'D', 'M', 'Y' or 'S', the seasons DJF, MAM, JJA, SON):
+    #count, sum, mean, min, max (NaN ignored) as (nperiod, ...) and percentile (nq, nperiod, ...) for q,
+    #period the first day and time the start of every period from the first to the last, NaN without data
+    def __init__(self, time, data, start, freq='M', unit='days', q=(25, 50, 75)):
+        data = np.asarray(data, dtype=float)
+        if not data.shape[0]:
+            raise ValueError('no data to resample')
+        shape = data.shape[1:]
+        ids = _period_ids(_dates(time, start, unit), freq)
+        order = np.argsort(ids, kind='stable')
+        ids = ids[order]
+        values = data.reshape(data.shape[0], -1)[order]
+        n, m = values.shape
+        #rows of every period with data
+        present, bounds = np.unique(ids, return_index=True)
+        slot = present - ids[0]
+        nperiod = int(ids[-1] - ids[0]) + 1
+        self.freq = freq
+        self.period = _period_start(np.arange(ids[0], ids[-1]+1), freq).astype('datetime64[D]')
+        self.time = _times(self.period, start, unit)
+
+        def full(x, fill=np.nan):
+            out = np.full((nperiod,)+x.shape[1:], fill, dtype=x.dtype if fill == 0 else float)
+            out[slot] = x
+            return out.reshape((nperiod,)+shape)
+
+        valid = ~np.isnan(values)
+        count = np.add.reduceat(valid, bounds, axis=0, dtype=np.int64)
+        total = np.add.reduceat(np.where(valid, values, 0), bounds, axis=0)
+        self.count = full(count, 0)
+        self.sum = full(np.where(count > 0, total, np.nan))
+        self.mean = full(np.divide(total, count, out=np.full(total.shape, np.nan), where=count > 0))
+        self.min = full(np.fmin.reduceat(values, bounds, axis=0))
+        self.max = full(np.fmax.reduceat(values, bounds, axis=0))
+
+        #percentiles (linear, as np.nanpercentile) of all columns at once from the rows of every period
+        #sorted by column (NaN last)
+        self.q = np.atleast_1d(np.asarray(q if q is not None else [], dtype=float))
+        ordered = np.empty_like(values)
+        for a, b in zip(bounds, np.append(bounds[1:], n)):
+            ordered[a:b] = np.sort(values[a:b], axis=0)
+        column = np.arange(m)
+        position = self.q[:, None, None]/100*(count - 1)
+        lo = np.floor(np.maximum(position, 0)).astype(np.int64)
+        hi = np.minimum(lo + 1, np.maximum(count - 1, 0))
+        low = ordered[bounds[:, None] + lo, column]
+        percentile = low + (position - lo)*(ordered[bounds[:, None] + hi, column] - low)
+        percentile[:, count == 0] = np.nan
+        self.percentile = np.stack([full(p) for p in percentile]).reshape((self.q.size, nperiod)+shape)
+
+    def GetData(self, j, stat='mean'):
+        return getattr(self, stat)[:, j]
+
+    def plot(self, j, stat='mean', ax=None, label=None):
+        if ax==None:
+            fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(8, 6))
+        ax.plot(self.period, getattr(self, stat)[:, j], drawstyle='steps-post', label=label)
+        try:
+            ax.set_ylabel(self.header[j]+' '+self.unit[j])
+        except:
+            ax.set_ylabel(self.header[j])
+        if label != None:
+            ax.legend()
+        return ax
+
+
 def SeasonBoxPlot(data1, data2, time, title, ticklabel):
     fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(8, 6))
     ax.boxplot([data1, data2])
@@ -5,9 +5,18 @@ Created on Sat Jan  7 22:21:43 2023
 @author: toru1
 """
 
+import os
+import re
+import itertools
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
-from utils_Hydrus import GetLines
+from utils_Hydrus import GetLines, BlockView, _SECONDS
+from HYDRUS_setting import HYDRUS2DSIMPLE_INIT
+
+_CALC_TIME = re.compile(r' *Calculation time.*?([-+]?[.0-9]+(?:[EeDd][-+]?[0-9]+)?) *$')
+_FLAGS = {'T': 1.0, 'F': 0.0}
+
 
 class v_Mean(GetLines):
     def __init__(self, CASENAME):
@@ -17,9 +26,12 @@ class v_Mean(GetLines):
         self.UnitLine = 1
         self.DataLine = 3
         self.skiplines = 10
-        self.fopen()
+        if self.loadCache():
+            return
+        self.fopen(self.DataLine)
         self.readHeader()
         self.readData()
+        self.saveCache()
 
 class h_Mean(GetLines):
     def __init__(self, CASENAME):
@@ -29,10 +41,13 @@ class h_Mean(GetLines):
         self.UnitLine = 1
         self.DataLine = 3
         self.skiplines = 3
-        self.fopen()
+        if self.loadCache():
+            return
+        self.fopen(self.DataLine)
 
         self.readHeader()
         self.readData()
+        self.saveCache()
 
 
 class Cum_Q(GetLines):
@@ -43,10 +58,13 @@ class Cum_Q(GetLines):
         self.UnitLine = 1
         self.DataLine = 3
         self.skiplines = 10
-        self.fopen()
+        if self.loadCache():
+            return
+        self.fopen(self.DataLine)
 
         self.readHeader()
         self.readData()
+        self.saveCache()
 
 class solute1(GetLines):
     def __init__(self, CASENAME):
@@ -56,11 +74,14 @@ class solute1(GetLines):
         self.UnitLine = 1
         self.DataLine = 3
         self.skiplines = 2
-        self.fopen()
+        if self.loadCache():
+            return
+        self.fopen(self.DataLine)
 
         self.readData()
         self.header = range(22)
         self.unit = ['[M/L]']*22
+        self.saveCache()
 
 class A_Level(GetLines):
     def __init__(self, CASENAME):
@@ -70,43 +91,44 @@ class A_Level(GetLines):
         self.UnitLine = 1
         self.DataLine = 3
         self.skiplines = 2
-        self.fopen()
+        if self.loadCache():
+            return
+        self.fopen(self.DataLine)
 
         self.readHeader()
         self.readData()
+        self.saveCache()
         
 class Boundary(GetLines):
-    def __init__(self, CASENAME, nnode, nPrintTime):
+    def __init__(self, CASENAME, lazy=False):
         self.FileName = 'Boundary.out'
         self.CASENAME = CASENAME
         self.HeaderLine = 4
         self.UnitLine = 5
         self.skiplines = 13
-        self.fopen()
+        if not lazy and self.loadCache():
+            return
+        self.fopen(self.UnitLine+1)
 
         self.readHeader()
-
-        nskip = 7
-        self.nnode = nnode
-        self.nPrintTime = nPrintTime
-        self.nrows = self.nnode+nskip
-        self.data = np.array([
-                    [line.split() for line in self.lines[nskip+n*self.nrows:(n+1)*self.nrows]]
-                    for n in range(self.nPrintTime)],
-                dtype=float)
-        self.time = np.array([self.lines[2+n*self.nrows].split()[1]
-                              for n in range(self.nPrintTime)], dtype=float)
-        self.depth = self.data[0, :, 1]
+        #lazy: the print times are read from the file when they are used (BlockView)
+        self.readBlocks(lazy)
+        self.depth = self.data[0][:, 1]
+        if not lazy:
+            self.saveCache()
         
     def GetData(self, j):
+        #(node, time), a view of data unless it is read lazily (BlockView)
+        if isinstance(self.data, BlockView):
+            return np.array([block[:, j] for t, block in self.iterBlocks()]).T
         return self.data[:, :, j].T
     
     def plot(self, j, ax=None, depthmin=None, step=1):
         if ax==None:
             fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(8, 6))
-        for i in range(0, self.nPrintTime, step):
-                ax.plot(self.data[i, :, j], self.depth,
-                        label='{:6d} day'.format(int(self.time[i])))
+        for t, block in self.iterBlocks(step=step):
+                ax.plot(block[:, j], self.depth,
+                        label='{:6d} day'.format(int(t)))
         ax.set_ylabel(self.header[1]+self.unit[0])
         try:
             ax.set_xlabel(self.header[j]+self.unit[j-1]) 
@@ -120,30 +142,30 @@ class Boundary(GetLines):
 
 
 class ObsNod(GetLines):
+    #2: data (time, node, value)
+    cacheVersion = 2
+
     def __init__(self, CASENAME):
         self.FileName = 'ObsNod.out'
         self.CASENAME = CASENAME
         self.HeaderLine = 2
         self.DataLine = 3
         self.skiplines = 3
-        self.fopen()
-
-        nValues = 5
-        data = np.array([line.split() for line in self.lines[self.DataLine:-2]],
-                        dtype=float)
-        self.data = np.split(data, list(range(1, data[0].size, nValues)), axis=1)
-        self.time = self.data[0][:, 0]
-        self.nNode = self.lines[0].replace('(', ' ').replace(')', ' ').split()
-        self.header = self.lines[self.HeaderLine].split()[:nValues+1]
+        if self.loadCache():
+            return
+        self.fopen(self.DataLine)
+
+        self.readObsNodes(5)
+        self.saveCache()
         
     def GetData(self, j):
-        data = [d[:, j] for d in self.data[1:]]
-        return data
+        #(node, time), a view of data
+        return self.data[:, :, j].T
 
     def plot(self, j, i, label, timemax=None, ax=None):
         if ax==None:
             fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(8, 6))
-        ax.plot(self.time, self.data[i+1][:, j], label=label)
+        ax.plot(self.time, self.data[:, i, j], label=label)
         ax.set_ylabel(self.header[j+1])
         ax.set_xlabel(self.header[0]+' '+self.unit_T)
         if timemax == None:
@@ -153,56 +175,127 @@ class ObsNod(GetLines):
         return ax
         
 class Run_Info(GetLines):
+    #solver telemetry, one row per time level: TLevel, time, dt, iterations (Iter), cumulative (ItCum),
+    #converged (Convergency T/F), rejected (the time level is written again with a smaller dt) and
+    #retried (ItCum grows by more than Iter: iterations of attempts that were not written),
+    #dtMin and TUnit from Selector.in, CalcTime the calculation time [sec]
+    cacheVersion = 2
+
     def __init__(self, CASENAME):
         self.FileName = 'Run_Info.out'
         self.CASENAME = CASENAME
         self.skiplines = 2
         self.HeaderLine = 0
         self.DataLine = 2
-        self.fopen()
+        if self.loadCache():
+            return
+        self.fopen(self.DataLine)
 
         self.header = self.lines[self.HeaderLine].split()
-        self.readData()
-        
+        self.readRunInfo()
+        self.readSelector()
+        if self.CalcTime is None and os.path.isfile(os.path.join('.', CASENAME, 'Balance.out')):
+            #otherwise only at the end of Balance.out
+            self.CalcTime = Balance(CASENAME).CalcTime
+        self.saveCache()
+
+    def _cacheFiles(self):
+        return [self.path] + [os.path.join('.', self.CASENAME, name) for name in ('Selector.in', 'Balance.out')]
+
+    def readRunInfo(self):
+        #numbers and T/F as 1/0, the lines that are not a time level (e.g. "end") are skipped
+        rows = []
+        self.CalcTime = None
+        with open(self.path) as f:
+            for line in itertools.islice(f, self.skiplines+self.DataLine, None):
+                m = _CALC_TIME.match(line)
+                if m is not None:
+                    self.CalcTime = float(m.group(1).replace('D', 'E'))
+                    continue
+                try:
+                    rows.append([_FLAGS[t] if t in _FLAGS else float(t.replace('D', 'E')) for t in line.split()])
+                except ValueError:
+                    continue
+        rows = [row for row in rows if row]
+        self.data = np.full((len(rows), len(self.header)), np.nan)
+        for i, row in enumerate(rows):
+            self.data[i, :len(row)] = row[:len(self.header)]
+
+        self.time = self.column('Time')
+        self.TLevel = self.column('TLevel', np.arange(1, len(rows)+1))
+        self.dt = self.column('dt', np.diff(self.time, prepend=0))
+        self.iterations = self.column('Iter', np.zeros(len(rows)))
+        self.cumulative = self.column('ItCum', np.cumsum(self.iterations))
+        self.converged = self.column('Convergency', np.ones(len(rows))) == 1
+        self.rejected = np.append(self.TLevel[1:] <= self.TLevel[:-1], False)
+        self.retried = np.diff(self.cumulative, prepend=0) > self.iterations
+
+    def readSelector(self):
+        setting = HYDRUS2DSIMPLE_INIT()
+        setting.path = os.path.join('.', self.CASENAME)
+        try:
+            setting.read_Selector()
+        except (OSError, ValueError, IndexError):
+            pass
+        self.dtMin = float(setting.dtMin)
+        self.TUnit = str(setting.TUnit).strip()
+        self.tInit = float(setting.tInit)
+        self.unit_T = self.TUnit
+
+    def column(self, name, default=None):
+        #column of the header name (not case sensitive), default if there is none
+        names = [h.lower() for h in self.header]
+        if name.lower() in names:
+            return self.data[:, names.index(name.lower())]
+        return default
+
+    def summary(self, dtMin=None):
+        #numerical cost of the run: time steps, rejected steps, total iterations, iterations per step,
+        #share of the steps at dtMin, iterations per simulated day and calculation time
+        dtMin = self.dtMin if dtMin is None else dtMin
+        accepted = ~self.rejected
+        steps = int(accepted.sum())
+        iterations = float(self.cumulative[-1]) if self.time.size else 0.0
+        days = (self.time.max() - self.tInit)*_SECONDS.get(self.TUnit[:3].lower(), 86400)/86400 if self.time.size else 0.0
+        #written and not written rejected attempts (at least one per retried step)
+        return {'steps': steps,
+                'rejected': int(self.rejected.sum() + (accepted & self.retried).sum()),
+                'unconverged': int((accepted & ~self.converged).sum()),
+                'iterations': iterations,
+                'iter_per_step': iterations/steps if steps else np.nan,
+                'at_dtMin': float(np.mean(self.dt[accepted] <= dtMin*(1+1e-6))) if steps else np.nan,
+                'iter_per_day': float(iterations/days) if days > 0 else np.nan,
+                'max_iter': float(self.iterations.max()) if steps else np.nan,
+                'calc_time': np.nan if self.CalcTime is None else self.CalcTime}
+
+
+def Telemetry(cases, summary=None, dtMin=None):
+    #Run_Info summaries of several runs, one row per case, also written to summary (.csv)
+    table = pd.DataFrame([dict(case=case, **Run_Info(case).summary(dtMin)) for case in cases],
+                         columns=['case', 'steps', 'rejected', 'unconverged', 'iterations', 'iter_per_step',
+                                  'at_dtMin', 'iter_per_day', 'max_iter', 'calc_time'])
+    if summary is not None:
+        table.to_csv(summary, index=False)
+    return table
+
 class Balance(GetLines):
-    def __init__(self, CASENAME, nPrintTime):
+    def __init__(self, CASENAME):
         self.FileName = 'Balance.out'
         self.CASENAME = CASENAME
-        self.skiplines = 7
-        self.fopen()
-
-
-        nskip = 7
-        self.nnode = 13
-        self.nPrintTime = nPrintTime
-        self.nrows = self.nnode+nskip
-        while True:
-            try:
-                data =[[[line[:9], line[9:16], line[19:32]] 
-                        for line in self.lines[nskip+n*self.nrows:(n+1)*self.nrows]]
-                       for n in range(3, self.nPrintTime)]
-                self.data = np.array([[d[2] for d in ds] for ds in data], dtype=float)
-                break
-            except:
-                del self.lines[0]
-                self.skiplines += 1
-        
-        self.header = [d[0] for d in data[0]]
-        unit = [d[1] for d in data[0]]
-        self.unit = [s.replace('L', self.unit_L)
-                     .replace('T', self.unit_T)
-                     .replace('M', self.unit_M)
-                     .replace('V', self.unit_V) for s in unit]
-        self.time = np.array([self.lines[3+n*self.nrows].split()[2]
-                              for n in range(3, self.nPrintTime)], dtype=float)
+        self.skiplines = 0
+        if self.loadCache():
+            return
+        self.fopen(0)
+        self.readBalance()
+        self.saveCache()
         
-    def GetData(self, j):
-        return self.data[:, j].T
+    def GetData(self, j, k=0):
+        return self.data[:, j, k]
     
-    def plot(self, j, ax=None):
+    def plot(self, j, ax=None, k=0):
         if ax==None:
             fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(8, 6))
-        ax.plot(self.time, self.data[:, j])
+        ax.plot(self.time, self.data[:, j, k], label='Sub-region '+str(k+1))
         ax.set_xlabel('time '+self.unit_T)
         try:
             ax.set_ylabel(self.header[j]+self.unit[j]) 
@@ -210,3 +303,112 @@ class Balance(GetLines):
             ax.set_ylabel(self.header[j])
         ax.legend()
         return ax
+
+
+class NodalField(GetLines):
+    #binary nodal output of H2D_Calc64: for every print time the time and nValues*NumNP values (float32),
+    #data (nTimes, NumNP) or (nTimes, NumNP, nValues) memory-mapped (mmap=False: read into memory),
+    #x, z the coordinates of the nodes from Meshtria.txt
+    FileName = None
+    nValues = 1
+
+    def __init__(self, CASENAME, NumNP=None, mmap=True):
+        self.CASENAME = CASENAME
+        self.skiplines = 0
+        self.fopen(0)
+        self.readMesh()
+        if NumNP is not None:
+            self.NumNP = NumNP
+        self.readField(mmap)
+
+    def readMesh(self):
+        mesh = HYDRUS2DSIMPLE_INIT()
+        mesh.path = os.path.join('.', self.CASENAME)
+        self.x = self.z = self.NodeOrder = None
+        self.NumNP = None
+        if os.path.isfile(os.path.join(mesh.path, 'Meshtria.txt')):
+            mesh.read_Meshtria()
+            self.x, self.z = mesh.node_coords.T
+            self.node_x, self.node_z = mesh.node_x, mesh.node_z
+            self.NodeOrder = mesh.NodeOrder
+            self.NumNP = self.x.size
+
+    def readField(self, mmap=True):
+        if self.NumNP is None:
+            raise ValueError('NumNP is needed without Meshtria.txt')
+        size = os.path.getsize(self.path)
+        values = ('values', '<f4', (self.nValues*self.NumNP,))
+        record = np.dtype([('time', '<f4'), values])
+        #Fortran sequential records carry their length before and after
+        marked = np.dtype([('head', '<i4'), ('time', '<f4'), values, ('tail', '<i4')])
+        if size % record.itemsize and not size % marked.itemsize:
+            record = marked
+        #a record still being written is left out
+        nTimes = size // record.itemsize
+        if mmap and nTimes:
+            records = np.memmap(self.path, dtype=record, mode='r', shape=(nTimes,))
+        else:
+            records = np.fromfile(self.path, dtype=record, count=nTimes)
+        self.time = records['time'].astype(float)
+        self.nPrintTime = nTimes
+        self.data = records['values']
+        if self.nValues > 1:
+            #(x, z) components one after the other -> (nTimes, NumNP, nValues)
+            self.data = self.data.reshape(nTimes, self.nValues, self.NumNP).transpose(0, 2, 1)
+
+    def index(self, time):
+        #print time closest to time
+        return int(np.abs(self.time - time).argmin())
+
+    def GetData(self, i):
+        return np.asarray(self.data[i], dtype=float)
+
+    def iterBlocks(self, start=None, stop=None, step=None):
+        #print times one at a time: (time, values), read from the file as they are needed
+        for i in range(*slice(start, stop, step).indices(self.nPrintTime)):
+            yield self.time[i], self.GetData(i)
+
+    def grid(self, i, k=0):
+        #values of print time i on the grid (nnode_z, nnode_x) of the rectangular domain
+        values = self.GetData(i)
+        if self.nValues > 1:
+            values = values[:, k]
+        order = np.arange(self.NumNP) if self.NodeOrder is None else self.NodeOrder
+        grid = np.full(self.node_z.size*self.node_x.size, np.nan)
+        grid[order] = values
+        return grid.reshape(self.node_z.size, self.node_x.size)
+
+    def plot(self, i, k=0, ax=None, levels=20, cmap='RdBu'):
+        if ax==None:
+            fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(8, 6))
+        values = self.GetData(i)
+        if self.nValues > 1:
+            values = values[:, k]
+        c = ax.tricontourf(self.x, self.z, values, levels=levels, cmap=cmap)
+        ax.figure.colorbar(c, ax=ax)
+        ax.set_title('{} {:g} {}'.format(self.FileName, self.time[i], self.unit_T))
+        ax.set_xlabel('x [{}]'.format(self.unit_L))
+        ax.set_ylabel('z [{}]'.format(self.unit_L))
+        ax.set_aspect('equal')
+        return ax
+
+
+class h(NodalField):
+    FileName = 'h.out'
+
+
+class th(NodalField):
+    FileName = 'th.out'
+
+
+class v(NodalField):
+    FileName = 'v.out'
+    nValues = 2
+
+
+class Temp(NodalField):
+    FileName = 'Temp.out'
+
+
+class Conc(NodalField):
+    FileName = 'Conc.out'